@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+current_dir_path = os.path.dirname(os.path.realpath(__file__))
+parent_dir_path = os.path.dirname(current_dir_path)
+sys.path.append(parent_dir_path)
+
+import numpy as np
+import OpenEXR
+
+from exr_reader import OpenEXRReader, OpenEXRWrapper
+from exr_writer import write_exr, recompress, COMPRESSIONS
+
+
+LOADERS = ('none', 'numpy', 'torch')
+CODECS = ('NONE', 'RLE', 'ZIPS', 'ZIP', 'PIZ', 'B44', 'DWAA')
+
+
+def synthetic_frame(filepath: str, resolution: tuple[int,int], compression: str, seed: int = 0) -> None:
+    '''Write a synthetic BAT-like frame (RGBA, Class/Instance IDs, depth, normals and flow) to an EXR file
+
+    Args:
+     - filepath: Path of the exr file to write
+     - resolution: Resolution of the image (height,width)
+     - compression: Name of the compression (See exr_writer.COMPRESSIONS)
+     - seed: Seed of the random objects in the frame
+    '''
+    rng = np.random.default_rng(seed)
+    height, width = resolution
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    class_id = np.zeros(resolution, dtype=np.float32)
+    instance_id = np.zeros(resolution, dtype=np.float32)
+    # Rectangular objects with constant IDs, like the segmentation channels of rendered scenes
+    for instance in range(1, 21):
+        y0, x0 = rng.integers(0, height), rng.integers(0, width)
+        h, w = rng.integers(height // 20, height // 4), rng.integers(width // 20, width // 4)
+        class_id[y0:y0 + h, x0:x0 + w] = rng.integers(1, 5)
+        instance_id[y0:y0 + h, x0:x0 + w] = instance
+    depth = 2.0 + y / height * 10.0 + rng.normal(0, 0.01, resolution).astype(np.float32)
+    channels = {
+        'r': class_id * instance_id * 0.2, 'g': class_id * instance_id * 0.5, 'b': class_id * instance_id * 0.8,
+        'a': (class_id > 0).astype(np.float32), 'c': class_id, 'i': instance_id, 'd': depth,
+        'nx': np.sin(x / width * np.pi), 'ny': np.cos(y / height * np.pi), 'nz': np.ones(resolution, np.float32),
+        'fx': rng.normal(0, 1, resolution).astype(np.float32), 'fy': rng.normal(0, 1, resolution).astype(np.float32),
+    }
+    exr = OpenEXRWrapper(None, list(channels), resolution, channels, None)
+    write_exr(filepath, exr, compression)
+
+
+def _peak_rss_mb() -> float:
+    '''Get the peak resident set size of this process in MB
+    '''
+    # VmHWM is reset when a process starts, ru_maxrss also counts the parent process before exec on Linux
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # Kilobytes on Linux
+
+
+def _load_module(loader: str):
+    '''Import the loader module by name
+    '''
+    if loader == 'numpy':
+        return np
+    if loader == 'torch':
+        import torch
+        return torch
+    return None
+
+
+def _run(filepath: str, channel_string: str, loader: str, repeat: int, queue: multiprocessing.Queue) -> None:
+    '''Measure the reading of a file with a loader (Runs in a new process, so the peak RSS is its own)
+    '''
+    module = _load_module(loader)
+    baseline_rss = _peak_rss_mb()
+
+    def timed(function, number: int = repeat) -> float:
+        times = []
+        for _ in range(number):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return float(np.median(times))
+
+    def open_close():
+        with OpenEXRReader(filepath, channel_string, module, lazy=True):
+            pass
+
+    def read_header():
+        inputfile = OpenEXR.InputFile(filepath)
+        inputfile.header()
+        inputfile.close()
+
+    def decode_channel(channel_key):
+        def decode():
+            with OpenEXRReader(filepath, channel_string, module, lazy=True) as exr:
+                getattr(exr, channel_key)
+        return decode
+
+    def decode_all():
+        with OpenEXRReader(filepath, channel_string, module) as exr:
+            return exr
+
+    exr = decode_all()
+    decoded_bytes = sum(np.asarray(data).nbytes if not isinstance(data, list) else 4*len(data)
+                        for data in exr.channels.values())
+    results = {
+        'open_ms': timed(open_close) * 1e3,
+        'header_ms': timed(read_header) * 1e3,
+        'channel_ms': {key: timed(decode_channel(key)) * 1e3 for key in exr.channel_names},
+        'frame_ms': timed(decode_all) * 1e3,
+    }
+    results['decoded_mb_s'] = decoded_bytes / 1e6 / (results['frame_ms'] / 1e3)
+    results['file_mb_s'] = os.path.getsize(filepath) / 1e6 / (results['frame_ms'] / 1e3)
+    results['peak_rss_mb'] = _peak_rss_mb() - baseline_rss
+    queue.put(results)
+
+
+def measure(filepath: str, channel_string: str, loader: str, repeat: int) -> dict:
+    '''Measure the reading of a file with a loader in a new process
+
+    Args:
+     - filepath: Path to the exr file
+     - channel_string: String describing which channels to load (See OpenEXRReader)
+     - loader: Name of the loader ('none', 'numpy' or 'torch')
+     - repeat: Number of repetitions of each measurement (The median is reported)
+
+    Returns:
+     - results: Open and header read latency, decode time per channel and of all channels (in ms), decoding
+                throughput (MB/s of decoded data and of the file) and peak RSS increase (MB)
+    '''
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run, args=(filepath, channel_string, loader, repeat, queue))
+    process.start()
+    results = queue.get()
+    process.join()
+    return results
+
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmark reading EXR files with OpenEXRReader')
+    parser.add_argument('--files', nargs='*', default=[os.path.join(parent_dir_path, 'test', '0001.exr')],
+                        help='EXR files to benchmark (re-encoded with every codec)')
+    parser.add_argument('--synthetic', type=int, nargs=2, default=None, metavar=('HEIGHT', 'WIDTH'),
+                        help='Also benchmark a synthetic frame of this resolution')
+    parser.add_argument('--channels', default='rgbcid', help='Channel string of the channels to load')
+    parser.add_argument('--loaders', nargs='*', default=list(LOADERS), choices=LOADERS)
+    parser.add_argument('--codecs', nargs='*', default=list(CODECS), choices=list(COMPRESSIONS))
+    parser.add_argument('--repeat', type=int, default=5, help='Number of repetitions of each measurement')
+    parser.add_argument('--json', default=None, help='Path of a JSON file to write the results to')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # Re-encode the files (and write the synthetic frame) with every codec
+        sources = []
+        for filepath in args.files:
+            name = os.path.splitext(os.path.basename(filepath))[0]
+            for codec in args.codecs:
+                output_path = os.path.join(directory, '{}_{}.exr'.format(name, codec))
+                recompress(filepath, output_path, codec)
+                sources.append((name, codec, output_path))
+        if args.synthetic:
+            name = 'synthetic_{}x{}'.format(*args.synthetic)
+            for codec in args.codecs:
+                output_path = os.path.join(directory, '{}_{}.exr'.format(name, codec))
+                synthetic_frame(output_path, tuple(args.synthetic), codec)
+                sources.append((name, codec, output_path))
+
+        print('{:<24} {:<6} {:<6} {:>9} {:>8} {:>9} {:>9} {:>12} {:>9} {:>9}'.format(
+            'file', 'codec', 'loader', 'size MB', 'open ms', 'header ms', 'frame ms', 'decoded MB/s', 'file MB/s',
+            'peak MB'))
+        for name, codec, filepath in sources:
+            for loader in args.loaders:
+                result = measure(filepath, args.channels, loader, args.repeat)
+                result.update({'file': name, 'codec': codec, 'loader': loader,
+                               'size_mb': os.path.getsize(filepath) / 1e6})
+                results.append(result)
+                print('{file:<24} {codec:<6} {loader:<6} {size_mb:>9.2f} {open_ms:>8.3f} {header_ms:>9.3f} '
+                      '{frame_ms:>9.2f} {decoded_mb_s:>12.1f} {file_mb_s:>9.1f} {peak_rss_mb:>9.1f}'.format(**result))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,30 @@
+import os
+import sys
+import gc
+import timeit
+current_dir_path = os.path.dirname(os.path.realpath(__file__))
+parent_dir_path = os.path.dirname(current_dir_path)
+sys.path.append(parent_dir_path)
+
+from exr_reader import OpenEXRReader
+
+
+# Measures the overhead of opening and closing an EXR file with OpenEXRReader (no channel is decoded)
+if __name__=='__main__':
+    filepath = os.path.join(parent_dir_path, 'test', '0001.exr')
+    number = 2000
+
+    def open_close():
+        with OpenEXRReader(filepath, 'cirgbadnxnynz', lazy=True):
+            pass
+
+    open_close()
+    seconds = timeit.timeit(open_close, number=number)
+    print('Open/close overhead: {:.1f} us'.format(seconds / number * 1e6))
+
+    # Objects left behind for the garbage collector (e.g. classes created per file)
+    gc.collect()
+    gc_objects = len(gc.get_objects())
+    for _ in range(1000):
+        open_close()
+    print('Objects tracked by the GC after 1000 opens: {:+d}'.format(len(gc.get_objects()) - gc_objects))
@@ -0,0 +1,225 @@
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory, resource_tracker
+from collections import deque
+from typing import Any, Callable, Iterable, Iterator
+import weakref
+import os
+
+import numpy as np
+
+from exr_reader import OpenEXRReader, OpenEXRWrapper
+
+
+def _read(filepath: str, channel_string: str, loader: Any, reader_kwargs: dict) -> OpenEXRWrapper:
+    '''Open an EXR file, load the channels and close it again
+
+    Args:
+     - filepath: Path to the exr file
+     - channel_string: String describing which channels to load
+     - loader: Module to use to load the channel data
+     - reader_kwargs: Additional arguments of OpenEXRReader
+
+    Returns:
+     - exr: The exr object of the file (The channels and the header stay available after the file is closed)
+    '''
+    with OpenEXRReader(filepath, channel_string, loader, **reader_kwargs) as exr:
+        return exr
+
+
+def _read_to_shared_memory(filepath: str, channel_string: str, reader_kwargs: dict) -> dict:
+    '''Load the channels of an EXR file into a new shared memory block (Runs in the worker processes)
+
+    Args:
+     - filepath: Path to the exr file
+     - channel_string: String describing which channels to load
+     - reader_kwargs: Additional arguments of OpenEXRReader
+
+    Returns:
+     - result: Name of the shared memory block and everything needed to rebuild the exr object from it.
+               The block is not unlinked, this is done by the process receiving the result.
+    '''
+    with OpenEXRReader(filepath, channel_string, np, **reader_kwargs) as exr:
+        # The stacked array is stored as one block, otherwise the channels are stored one after the other
+        if exr.stacked is not None:
+            arrays = [('stacked', exr.stacked)]
+        else:
+            arrays = list(exr.channels.items())
+
+        layout = []
+        offset = 0
+        for key, data in arrays:
+            layout.append((key, offset, data.dtype.str, data.shape))
+            offset += data.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for (key, offset, dtype, shape), (_, data) in zip(layout, arrays):
+                np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = data
+        finally:
+            shm.close()
+
+        return {'name': shm.name, 'layout': layout, 'filepath': filepath, 'channel_names': exr.channel_names,
+                'resolution': exr.resolution, 'shape': exr.shape, 'window': exr.window, 'header': exr.header,
+                'stack': reader_kwargs.get('stack')}
+
+
+def _attach_shared_memory(result: dict, loader: Any) -> OpenEXRWrapper:
+    '''Build the exr object from the shared memory block filled by a worker process, without copying the data
+
+    Args:
+     - result: Result of _read_to_shared_memory
+     - loader: Module to use to load the channel data (NumPy or PyTorch)
+
+    Returns:
+     - exr: The exr object of the file, its channels are views of the shared memory block
+    '''
+    shm = shared_memory.SharedMemory(name=result['name'])
+    # Unlink right away, the memory stays mapped until the views of it are deleted
+    shm.unlink()
+    base = np.ndarray((shm.size,), np.uint8, buffer=shm.buf)
+    weakref.finalize(base, shm.close)  # Unmap the block once the last view of it is deleted
+
+    arrays = {key: base[offset:offset + np.dtype(dtype).itemsize*int(np.prod(shape))].view(dtype).reshape(shape)
+              for key, offset, dtype, shape in result['layout']}
+    if loader is not np:
+        # UINT channels are converted to int64 (copied), like by OpenEXRReader with the PyTorch loader
+        arrays = {key: loader.from_numpy(data.astype(np.int64) if data.dtype == np.uint32 else data)
+                  for key, data in arrays.items()}
+    stacked = arrays.pop('stacked', None)
+    if stacked is not None:
+        for index, key in enumerate(result['channel_names']):
+            arrays[key] = stacked[..., index] if result['stack'] == 'hwc' else stacked[index]
+    return OpenEXRWrapper(None, result['channel_names'], result['resolution'], arrays, result['header'],
+                          result['filepath'], stacked, shape=result['shape'], window=result['window'])
+
+
+def _schedule(submit: Callable[[str], Future], paths: Iterable[str], prefetch: int, ordered: bool,
+              discard: Callable[[Any], None] = None) -> Iterator[Any]:
+    '''Submit jobs for the paths to an executor and yield their results
+
+    Args:
+     - submit: Function submitting the job of a path to the executor and returning its future
+     - paths: Paths to submit jobs for
+     - prefetch: Number of jobs submitted ahead of the consumer
+     - ordered: If True, the results are yielded in the order of paths, otherwise in the order they are completed
+     - discard: Function called with the results that are not yielded because the generator is closed early
+
+    Returns:
+     - results: Generator of the results of the jobs
+    '''
+    paths = iter(paths)
+    pending = deque()
+
+    def submit_next() -> bool:
+        filepath = next(paths, None)
+        if filepath is None:
+            return False
+        pending.append(submit(filepath))
+        return True
+
+    # Keep a bounded number of files in flight, so memory does not grow with the number of paths
+    while len(pending) < prefetch and submit_next():
+        pass
+
+    try:
+        if ordered:
+            while pending:
+                future = pending.popleft()
+                submit_next()
+                yield future.result()
+        else:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    submit_next()
+                    yield future.result()
+    finally:
+        # Cancel the jobs that did not start yet and discard the results of the others
+        for future in pending:
+            if not future.cancel() and discard is not None and future.exception() is None:
+                discard(future.result())
+
+
+def _unlink_shared_memory(result: dict) -> None:
+    '''Free the shared memory block of a result of _read_to_shared_memory that is not used
+
+    Args:
+     - result: Result of _read_to_shared_memory
+    '''
+    shm = shared_memory.SharedMemory(name=result['name'])
+    shm.close()
+    shm.unlink()
+
+
+def read_many(paths: Iterable[str], channel_string: str, loader: Any = None, workers: int = None,
+              ordered: bool = True, prefetch: int = None, **reader_kwargs) -> Iterator[OpenEXRWrapper]:
+    '''Read many EXR files concurrently in a thread pool (OpenEXR releases the GIL while decoding)
+
+    Args:
+     - paths: Paths to the exr files
+     - channel_string: String describing which channels to load (See OpenEXRReader)
+     - loader: Module to use to load the channel data (See OpenEXRReader)
+     - workers: Number of threads (Defaults to the number of CPUs)
+     - ordered: If True (default), the results are yielded in the order of paths, otherwise in the order they
+                are completed (exr.filepath tells which file a result belongs to)
+     - prefetch: Number of files decoded ahead of the consumer (Defaults to 2*workers)
+     - reader_kwargs: Additional arguments of OpenEXRReader (e.g. roi, dtypes, stack)
+
+    Returns:
+     - results: Generator of the exr objects of the files
+
+    Usage:
+    for exr in read_many(PATHS, 'rgb', np, workers=16):
+        ...
+    '''
+    if 'out' in reader_kwargs or reader_kwargs.get('lazy'):
+        raise ValueError('read_many does not support shared output buffers (out) or lazy loading')
+    workers = workers or os.cpu_count() or 1
+    prefetch = prefetch or 2*workers
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        submit = lambda filepath: executor.submit(_read, filepath, channel_string, loader, reader_kwargs)
+        yield from _schedule(submit, paths, prefetch, ordered)
+
+
+def read_many_processes(paths: Iterable[str], channel_string: str, loader: Any = np, workers: int = None,
+                        ordered: bool = True, prefetch: int = None, **reader_kwargs) -> Iterator[OpenEXRWrapper]:
+    '''Read many EXR files concurrently in a process pool, passing the channels back through shared memory
+
+    The worker processes decode the channels into shared memory blocks, the channels of the yielded exr objects
+    are views of these blocks, so the data is not pickled or copied. A block is freed when its views are deleted.
+
+    Args:
+     - paths: Paths to the exr files
+     - channel_string: String describing which channels to load (See OpenEXRReader)
+     - loader: Module to use to load the channel data (NumPy or PyTorch)
+     - workers: Number of processes (Defaults to the number of CPUs)
+     - ordered: If True (default), the results are yielded in the order of paths, otherwise in the order they
+                are completed (exr.filepath tells which file a result belongs to)
+     - prefetch: Number of files decoded ahead of the consumer (Defaults to 2*workers)
+     - reader_kwargs: Additional arguments of OpenEXRReader (e.g. roi, dtypes, stack)
+
+    Returns:
+     - results: Generator of the exr objects of the files
+
+    Usage:
+    for exr in read_many_processes(PATHS, 'rgb', np, workers=16):
+        ...
+    '''
+    if not loader:
+        raise ValueError('read_many_processes requires NumPy or PyTorch as the loader')
+    if 'out' in reader_kwargs or reader_kwargs.get('lazy'):
+        raise ValueError('read_many_processes does not support shared output buffers (out) or lazy loading')
+    if 'dtypes' in reader_kwargs and loader is not np:
+        raise ValueError('read_many_processes only supports dtypes with NumPy as the loader')
+    workers = workers or os.cpu_count() or 1
+    prefetch = prefetch or 2*workers
+
+    # Start the resource tracker before the workers, so they share it with this process. The tracker then only
+    # unlinks the blocks that were not received (e.g. if the generator is not exhausted) when this process exits.
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        submit = lambda filepath: executor.submit(_read_to_shared_memory, filepath, channel_string, reader_kwargs)
+        for result in _schedule(submit, paths, prefetch, ordered, _unlink_shared_memory):
+            yield _attach_shared_memory(result, loader)
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+import threading
+import hashlib
+import sys
+import os
+
+import numpy as np
+
+
+def nbytes(data: Any) -> int:
+    '''Get the (approximate) memory used by the data of a channel
+
+    Args:
+     - data: NumPy array, PyTorch tensor or list of Python numbers
+
+    Returns:
+     - size: Size of the data in bytes
+    '''
+    if isinstance(data, list):
+        # The list and the number objects (24 bytes for floats and small ints)
+        return sys.getsizeof(data) + 24*len(data)
+    return int(data.nbytes)
+
+
+class ChannelCache():
+    '''In-memory LRU cache of decoded channels, limited by the total size of the channels
+
+    Args:
+     - max_bytes: Maximum total size of the cached channels in bytes. The least recently used channels are evicted
+                  when it is exceeded.
+
+    Usage:
+    cache = ChannelCache(8 * 1024**3)
+    for epoch in range(EPOCHS):
+        for path in PATHS:
+            with OpenEXRReader(path, 'rgb', np, cache=cache) as exr:
+                ...
+
+    The cached channels are shared between readers, so they should not be modified (See the writable argument of
+    OpenEXRReader). The cache can be shared between threads and by readers with different loaders.
+    '''
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key: (data, size), in the order of use
+        self._lock = threading.Lock()
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+
+    def get(self, key: Hashable) -> Any:
+        '''Get a channel from the cache and mark it as recently used
+
+        Args:
+         - key: Key of the channel
+
+        Returns:
+         - data: Data of the channel or None if it is not in the cache
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+
+    def put(self, key: Hashable, data: Any) -> None:
+        '''Add a channel to the cache and evict the least recently used channels if the cache is full
+
+        Args:
+         - key: Key of the channel
+         - data: Data of the channel (Not added if it is larger than max_bytes)
+        '''
+        size = nbytes(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (data, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+
+
+    def clear(self) -> None:
+        '''Remove all channels from the cache
+        '''
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class DiskChannelCache():
+    '''Cache of decoded channels stored as .npy files, which are memory-mapped when read
+
+    Reading the raw arrays is much cheaper than decompressing the EXR files, and processes reading the same
+    channels (e.g. DataLoader workers) share the memory-mapped files through the page cache.
+
+    Args:
+     - directory: Directory of the .npy files (Created if it does not exist)
+
+    Usage:
+    cache = DiskChannelCache('/nvme/exr_cache')
+    with OpenEXRReader(PATH, 'rgb', np, cache=cache) as exr:
+        ...
+
+    The cache returns read-only memory-mapped NumPy arrays, the readers convert them to the type of their loader. Files are identified by their path, modification time and size, files of modified EXR files
+    are not removed automatically.
+    '''
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+
+    def __contains__(self, key: Hashable) -> bool:
+        return os.path.exists(self._path(key))
+
+
+    def get(self, key: Hashable) -> Any:
+        '''Get a channel from the cache
+
+        Args:
+         - key: Key of the channel
+
+        Returns:
+         - data: Data of the channel (read-only memory-mapped NumPy array) or None if it is not in the cache
+        '''
+        try:
+            return np.load(self._path(key), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+
+
+    def put(self, key: Hashable, data: Any) -> None:
+        '''Write a channel to the cache
+
+        Args:
+         - key: Key of the channel
+         - data: Data of the channel (List, NumPy array or PyTorch tensor)
+        '''
+        path = self._path(key)
+        # Write to a temporary file first, so other processes never read incomplete files
+        temporary_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(temporary_path, 'wb') as f:
+            np.save(f, np.asarray(data))
+        os.replace(temporary_path, path)
+
+
+    def clear(self) -> None:
+        '''Remove all channels from the cache
+        '''
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.npy'):
+                os.remove(os.path.join(self.directory, filename))
+
+
+    def _path(self, key: Hashable) -> str:
+        '''Get the path of the file of a channel
+
+        Args:
+         - key: Key of the channel
+
+        Returns:
+         - path: Path of the .npy file
+        '''
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + '.npy')
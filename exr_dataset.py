@@ -0,0 +1,105 @@
+from typing import Sequence
+import torch
+from torch.utils.data import Dataset, get_worker_info
+
+from exr_reader import OpenEXRReader
+
+
+class EXRDataset(Dataset):
+    '''PyTorch Dataset of EXR files generated by BAT
+
+    Each item is a tensor of the channels in the channel string, stacked in the given layout.
+
+    Args:
+     - paths: Paths to the exr files
+     - channel_string: String describing which channels to load (See OpenEXRReader)
+     - stack: Layout of the items, 'chw' (channels,height,width) or 'hwc' (height,width,channels)
+     - reader_kwargs: Additional arguments of OpenEXRReader (e.g. roi, dtypes)
+
+    Usage:
+    dataset = EXRDataset(PATHS, 'rgbd')
+    loader = DataLoader(dataset, batch_size=16, num_workers=8, pin_memory=True)
+
+    When the DataLoader fetches a batch, the channels are decoded into a buffer of the worker (see __getitems__),
+    that is reused for every batch, instead of allocating new tensors for every item. The collate function copies
+    the items into the batch, so pinned batches are requested with the pin_memory argument of the DataLoader.
+    '''
+    def __init__(self, paths: Sequence[str], channel_string: str, stack: str = 'chw', **reader_kwargs):
+        if 'out' in reader_kwargs or reader_kwargs.get('lazy'):
+            raise ValueError('EXRDataset does not support shared output buffers (out) or lazy loading')
+        self.paths = paths
+        self.channel_string = channel_string
+        self.stack = stack
+        self.reader_kwargs = reader_kwargs
+        self.buffers = {}  # Decode buffers of the workers (by worker id)
+
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+    def __getitem__(self, index: int) -> torch.Tensor:
+        '''Decode an item into a new tensor
+        '''
+        return self._read(index)
+
+
+    def __getitems__(self, indices: list[int]) -> list[torch.Tensor]:
+        '''Decode a batch of items into the reused buffer of the current worker
+
+        Returns:
+         - items: Views of the buffer, they are only valid until the next batch is fetched by the same worker
+                  (The collate function of the DataLoader copies them into the batch)
+        '''
+        worker_info = get_worker_info()
+        worker_id = worker_info.id if worker_info is not None else None
+        buffer = self.buffers.get(worker_id)
+
+        items = []
+        for position, index in enumerate(indices):
+            if buffer is None or position >= len(buffer):
+                # The shape of the items is only known after decoding the first one
+                item = self._read(index)
+                buffer = self._allocate(len(indices), item)
+                self.buffers[worker_id] = buffer
+                buffer[position].copy_(item)
+            else:
+                self._read(index, out=buffer[position])
+            items.append(buffer[position])
+        return items
+
+
+    def __getstate__(self) -> dict:
+        '''Do not copy the buffers of the main process to the worker processes
+        '''
+        state = self.__dict__.copy()
+        state['buffers'] = {}
+        return state
+
+
+    def _read(self, index: int, out: torch.Tensor = None) -> torch.Tensor:
+        '''Decode an item
+
+        Args:
+         - index: Index of the item
+         - out: Tensor to decode the item into (If None, a new tensor is allocated)
+
+        Returns:
+         - item: Tensor of the stacked channels
+        '''
+        with OpenEXRReader(self.paths[index], self.channel_string, torch, stack=self.stack, out=out,
+                           **self.reader_kwargs) as exr:
+            return exr.stacked
+
+
+    def _allocate(self, batch_size: int, item: torch.Tensor) -> torch.Tensor:
+        '''Allocate the buffer for a batch of items
+
+        Args:
+         - batch_size: Number of items in the batch
+         - item: An item, the items of the buffer get the same shape and data type
+
+        Returns:
+         - buffer: Tensor of shape (batch_size,)+item.shape
+        '''
+        return torch.empty((batch_size,) + tuple(item.shape), dtype=item.dtype)
@@ -0,0 +1,293 @@
+from typing import Any
+
+import numpy as np
+
+
+def _as_channel(data: Any, resolution: tuple[int,int]) -> np.ndarray:
+    '''Convert a channel (NumPy array, PyTorch tensor or list) to a float32 (H,W) array
+    '''
+    data = np.asarray(data, dtype=np.float32)
+    return data.reshape(resolution) if data.ndim == 1 else data
+
+
+class FlowWarper():
+    '''Warp images with optical flow and check the consistency of forward and backward flow, for one resolution
+
+    The flow is given in pixels as horizontal (X) and vertical (Y) components, as read by OpenEXRReader: exr.fx and
+    exr.fy are the forward flow (current frame to next), exr.fz and exr.fw are the backward flow (current frame to
+    previous). The reader already maps the keys to the swapped channels of BAT files (fx is Flow.G, fy is Flow.R).
+
+    The pixel grid and the intermediate arrays are allocated once, so warping and splatting (H,W) channels and
+    checking occlusions allocate no temporary arrays for the frames of a sequence. Results are written into out if it is given.
+
+    Args:
+     - resolution: Resolution of the images and flow (height,width)
+
+    Usage:
+    warper = FlowWarper(resolution)
+    with OpenEXRReader(PATH_T, 'rgbfxfy', np) as exr, OpenEXRReader(PATH_T1, 'rgbfzfw', np) as next_exr:
+        occluded = warper.occlusion(exr.fx, exr.fy, next_exr.fz, next_exr.fw)
+        next_r = warper.warp(next_exr.r, exr.fx, exr.fy)  # The next frame aligned to the current frame
+    '''
+    def __init__(self, resolution: tuple[int,int]):
+        height, width = resolution
+        if height < 2 or width < 2:
+            raise ValueError('FlowWarper requires a resolution of at least 2x2, got {}'.format(resolution))
+        self.resolution = (height, width)
+        self.grid_x = np.arange(width, dtype=np.float32)[None, :]
+        self.grid_y = np.arange(height, dtype=np.float32)[:, None]
+        # Sampling positions, bilinear weights and flat index of the top left neighbor of every pixel
+        self._x = np.empty(self.resolution, dtype=np.float32)
+        self._y = np.empty(self.resolution, dtype=np.float32)
+        self._wx = np.empty(self.resolution, dtype=np.float32)
+        self._wy = np.empty(self.resolution, dtype=np.float32)
+        self._index = np.empty(self.resolution, dtype=np.intp)
+        self._corner = np.empty(self.resolution, dtype=np.intp)
+        self._valid = np.empty(self.resolution, dtype=bool)
+        self._mask = np.empty(self.resolution, dtype=bool)
+        self._sample = np.empty(self.resolution, dtype=np.float32)
+        self._scratch = np.empty(self.resolution, dtype=np.float32)
+        self._backward = (np.empty(self.resolution, dtype=np.float32), np.empty(self.resolution, dtype=np.float32))
+        # Splatting targets, weights and accumulated weights and values, with a last bin for the pixels moved outside
+        # (float64, np.add.at is only fast without casting)
+        self._target = np.empty(height * width, dtype=np.intp)
+        self._weight = np.empty(height * width, dtype=np.float64)
+        self._contribution = np.empty(height * width, dtype=np.float64)
+        self._weights = np.empty(height * width + 1, dtype=np.float64)
+        self._sums = np.empty((0, height * width + 1), dtype=np.float64)  # Grows to the number of channels
+
+
+    def _check(self, data: Any, name: str) -> np.ndarray:
+        '''Convert a channel to a float32 array and check its resolution
+        '''
+        data = _as_channel(data, self.resolution)
+        if data.shape[:2] != self.resolution:
+            raise ValueError('{} has shape {}, expected resolution {}'.format(name, data.shape, self.resolution))
+        return data
+
+
+    def _sampling(self, flow_x: Any, flow_y: Any) -> None:
+        '''Compute the bilinear sampling of the positions p + flow(p) into the buffers of the warper
+        '''
+        height, width = self.resolution
+        flow_x = self._check(flow_x, 'flow_x')
+        flow_y = self._check(flow_y, 'flow_y')
+        x, y, wx, wy, index, valid, mask = self._x, self._y, self._wx, self._wy, self._index, self._valid, self._mask
+
+        np.add(self.grid_x, flow_x, out=x)
+        np.add(self.grid_y, flow_y, out=y)
+        # Positions outside of the image (or NaN) are invalid
+        np.greater_equal(x, 0, out=valid)
+        valid &= np.less_equal(x, width - 1, out=mask)
+        valid &= np.greater_equal(y, 0, out=mask)
+        valid &= np.less_equal(y, height - 1, out=mask)
+        np.invert(valid, out=mask)
+        x[mask] = 0  # Sampled anywhere, the result is replaced
+        y[mask] = 0
+
+        # The top left neighbor is clipped so that its bottom right neighbor is inside of the image
+        np.floor(x, out=wx)
+        np.clip(wx, 0, width - 2, out=wx)
+        np.subtract(x, wx, out=x)  # x is the weight of the right neighbors from here
+        index[...] = wx
+        np.floor(y, out=wy)
+        np.clip(wy, 0, height - 2, out=wy)
+        np.subtract(y, wy, out=y)  # y is the weight of the bottom neighbors from here
+        np.multiply(wy, width, out=wy)
+        np.add(index, wy, out=index, casting='unsafe')
+        np.clip(x, 0, 1, out=x)
+        np.clip(y, 0, 1, out=y)
+        np.subtract(1, x, out=wx)  # Weight of the left neighbors
+        np.subtract(1, y, out=wy)  # Weight of the top neighbors
+
+
+    def _gather(self, image: np.ndarray, out: np.ndarray) -> np.ndarray:
+        '''Bilinearly sample a single channel image at the positions computed by _sampling
+        '''
+        width = self.resolution[1]
+        flat = image.reshape(-1)
+        corner, sample, scratch = self._corner, self._sample, self._scratch
+        np.take(flat, self._index, out=sample)
+        np.multiply(sample, self._wx, out=out)
+        np.add(self._index, 1, out=corner)
+        np.take(flat, corner, out=sample)
+        np.multiply(sample, self._x, out=sample)
+        out += sample
+        out *= self._wy
+        corner += width
+        np.take(flat, corner, out=sample)
+        np.multiply(sample, self._x, out=scratch)
+        corner -= 1
+        np.take(flat, corner, out=sample)
+        np.multiply(sample, self._wx, out=sample)
+        scratch += sample
+        scratch *= self._y
+        out += scratch
+        return out
+
+
+    def warp(self, image: Any, flow_x: Any, flow_y: Any, fill: float = 0, out: np.ndarray = None) -> np.ndarray:
+        '''Backward warp an image: sample it at p + flow(p) for every pixel p, with bilinear interpolation
+
+        With the forward flow of frame t, this aligns frame t+1 to frame t (and with the backward flow of frame t,
+        frame t-1 to frame t).
+
+        Args:
+         - image: Image to warp, (H,W) or (H,W,C) (e.g. exr.r, or exr.stacked with stack='hwc')
+         - flow_x: Horizontal flow in pixels (H,W)
+         - flow_y: Vertical flow in pixels (H,W)
+         - fill: Value of the pixels sampled outside of the image
+         - out: float32 array of the shape of the image to write the warped image into
+
+        Returns:
+         - warped: Warped image (float32, the shape of the image)
+        '''
+        image = self._check(image, 'image')
+        if out is None:
+            out = np.empty(image.shape, dtype=np.float32)
+        self._sampling(flow_x, flow_y)
+        if image.ndim == 2:
+            self._gather(image, out)
+            np.copyto(out, fill, where=self._mask)
+            return out
+        channel = self._backward[0]
+        for c in range(image.shape[2]):
+            self._gather(np.ascontiguousarray(image[..., c]), channel)
+            out[..., c] = channel
+        np.copyto(out, fill, where=self._mask[..., None])
+        return out
+
+
+    def splat(self, image: Any, flow_x: Any, flow_y: Any, fill: float = 0, out: np.ndarray = None) -> np.ndarray:
+        '''Forward warp an image: move every pixel p to p + flow(p), with bilinear splatting
+
+        The pixels moved to the same position are averaged by their bilinear weights. With the forward flow of frame
+        t, this moves frame t to frame t+1.
+
+        Args:
+         - image: Image to warp, (H,W) or (H,W,C)
+         - flow_x: Horizontal flow in pixels (H,W)
+         - flow_y: Vertical flow in pixels (H,W)
+         - fill: Value of the pixels no pixel is moved to (disocclusions)
+         - out: float32 array of the shape of the image to write the warped image into
+
+        Returns:
+         - warped: Warped image (float32, the shape of the image)
+        '''
+        height, width = self.resolution
+        image = self._check(image, 'image')
+        flow_x = self._check(flow_x, 'flow_x')
+        flow_y = self._check(flow_y, 'flow_y')
+        if out is None:
+            out = np.empty(image.shape, dtype=np.float32)
+        values = image.reshape(height * width, -1)
+        if len(self._sums) < values.shape[1]:
+            self._sums = np.empty((values.shape[1], height * width + 1), dtype=np.float64)
+        weights, sums, target = self._weights, self._sums[:values.shape[1]], self._target
+        left, top, inside, outside = self._index, self._corner, self._valid, self._mask
+        weight, contribution = self._weight, self._contribution
+        weights[...] = 0
+        sums[...] = 0
+
+        x, y = self._x, self._y
+        np.add(self.grid_x, flow_x, out=x)
+        np.add(self.grid_y, flow_y, out=y)
+        np.floor(x, out=self._wx)
+        np.floor(y, out=self._wy)
+        left[...] = self._wx  # NaN positions get any index, their weights are NaN so they are left out below
+        top[...] = self._wy
+        np.subtract(x, self._wx, out=x)  # Weight of the right neighbors
+        np.subtract(y, self._wy, out=y)  # Weight of the bottom neighbors
+        np.subtract(1, x, out=self._wx)  # Weight of the left neighbors
+        np.subtract(1, y, out=self._wy)  # Weight of the top neighbors
+
+        for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            np.multiply(x if dx else self._wx, y if dy else self._wy, out=self._sample)
+            weight[...] = self._sample.reshape(-1)
+            # Corners outside of the image (and NaN weights) go to the last bin with zero weight
+            np.greater_equal(left, -dx, out=inside)
+            inside &= np.less(left, width - dx, out=outside)
+            inside &= np.greater_equal(top, -dy, out=outside)
+            inside &= np.less(top, height - dy, out=outside)
+            inside &= np.greater(self._sample, 0, out=outside)
+            np.invert(inside, out=outside)
+            np.multiply(top.reshape(-1), width, out=target)
+            target += left.reshape(-1)
+            target += dy * width + dx
+            np.copyto(target, height * width, where=outside.reshape(-1))
+            np.copyto(weight, 0, where=outside.reshape(-1))
+            np.add.at(weights, target, weight)
+            for c in range(values.shape[1]):
+                np.multiply(weight, values[:, c], out=contribution)
+                np.add.at(sums[c], target, contribution)
+
+        covered = np.greater(weights[:-1], 1e-6, out=inside.reshape(-1))
+        result = out.reshape(height * width, -1)
+        result[...] = fill
+        for c in range(values.shape[1]):
+            np.divide(sums[c, :-1], weights[:-1], out=result[:, c], where=covered, casting='unsafe')
+        return out
+
+
+    def occlusion(self, flow_x: Any, flow_y: Any, backward_x: Any, backward_y: Any, alpha1: float = 0.01,
+                  alpha2: float = 0.5, out: np.ndarray = None) -> np.ndarray:
+        '''Check the consistency of forward and backward flow to find the occluded pixels
+
+        A pixel p is occluded if the backward flow at p + F(p) does not take it back to p:
+        |F(p) + B(p+F(p))|^2 > alpha1 * (|F(p)|^2 + |B(p+F(p))|^2) + alpha2, or if p + F(p) is outside of the image.
+
+        Args:
+         - flow_x: Horizontal forward flow of frame t in pixels (exr.fx of frame t)
+         - flow_y: Vertical forward flow of frame t in pixels (exr.fy of frame t)
+         - backward_x: Horizontal backward flow of frame t+1 in pixels (exr.fz of frame t+1)
+         - backward_y: Vertical backward flow of frame t+1 in pixels (exr.fw of frame t+1)
+         - alpha1: Tolerance relative to the magnitude of the flow
+         - alpha2: Absolute tolerance in squared pixels
+         - out: (H,W) bool array to write the occlusion mask into
+
+        Returns:
+         - occluded: (H,W) bool array, True for the pixels of frame t that are occluded in frame t+1
+        '''
+        flow_x = self._check(flow_x, 'flow_x')
+        flow_y = self._check(flow_y, 'flow_y')
+        if out is None:
+            out = np.empty(self.resolution, dtype=bool)
+        self._sampling(flow_x, flow_y)
+        warped_x, warped_y = self._backward
+        self._gather(self._check(backward_x, 'backward_x'), warped_x)
+        self._gather(self._check(backward_y, 'backward_y'), warped_y)
+
+        # The buffers of the sampling are free again, they hold the squared magnitudes
+        magnitude, difference, scratch = self._x, self._y, self._scratch
+        np.multiply(flow_x, flow_x, out=magnitude)
+        magnitude += np.multiply(flow_y, flow_y, out=scratch)
+        magnitude += np.multiply(warped_x, warped_x, out=scratch)
+        magnitude += np.multiply(warped_y, warped_y, out=scratch)
+        magnitude *= alpha1
+        magnitude += alpha2
+        np.add(flow_x, warped_x, out=scratch)
+        np.multiply(scratch, scratch, out=difference)
+        np.add(flow_y, warped_y, out=scratch)
+        difference += np.multiply(scratch, scratch, out=scratch)
+
+        np.greater(difference, magnitude, out=out)
+        out |= self._mask  # Invalid positions
+        return out
+
+
+
+def occlusion_mask(exr: Any, next_exr: Any, alpha1: float = 0.01, alpha2: float = 0.5) -> np.ndarray:
+    '''Find the pixels of a frame that are occluded in the next frame by forward-backward consistency
+
+    Args:
+     - exr: The exr object of frame t with the fx and fy channels loaded
+     - next_exr: The exr object of frame t+1 with the fz and fw channels loaded
+     - alpha1: Tolerance relative to the magnitude of the flow (See FlowWarper.occlusion)
+     - alpha2: Absolute tolerance in squared pixels (See FlowWarper.occlusion)
+
+    Returns:
+     - occluded: (H,W) bool array, True for the pixels of frame t that are occluded in frame t+1
+
+    Use a FlowWarper directly to reuse its buffers for the frames of a sequence.
+    '''
+    return FlowWarper(exr.shape).occlusion(exr.fx, exr.fy, next_exr.fz, next_exr.fw, alpha1, alpha2)
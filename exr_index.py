@@ -0,0 +1,214 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+
+import numpy as np
+import Imath
+
+from exr_reader import parse_channel_string, read_header
+
+
+class EXRIndex():
+    '''Index of the EXR files in a directory tree (e.g. a BAT export), built from the headers of the files
+
+    For every file, the index stores the path (relative to the root), the resolution, the channels with their pixel
+    types, the compression, the file size and the modification time. It is saved as a single columnar .npz file,
+    so frames can be looked up and channel strings can be validated without opening the EXR files.
+
+    Args:
+     - root: Root directory of the indexed files
+     - paths: Paths of the files relative to root (bytes array)
+     - heights: Heights of the images
+     - widths: Widths of the images
+     - channel_sets: Distinct channel sets of the files, as 'name:PIXELTYPE;...' strings
+     - channel_set_ids: Index of the channel set of each file in channel_sets
+     - compressions: Compression of each file (Imath.Compression value)
+     - sizes: Size of each file in bytes
+     - mtimes: Modification time of each file in nanoseconds
+
+    Usage:
+    index = EXRIndex.build(ROOT)
+    index.save('index.npz')
+    ...
+    index = EXRIndex.load('index.npz')
+    paths = index.filepaths(index.has_channels('rgbd'))
+    '''
+    def __init__(self, root: str, paths: np.ndarray, heights: np.ndarray, widths: np.ndarray,
+                 channel_sets: np.ndarray, channel_set_ids: np.ndarray, compressions: np.ndarray,
+                 sizes: np.ndarray, mtimes: np.ndarray):
+        self.root = root
+        self.paths = paths
+        self.heights = heights
+        self.widths = widths
+        self.channel_sets = channel_sets
+        self.channel_set_ids = channel_set_ids
+        self.compressions = compressions
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self._positions = None  # Position of each path, built on the first lookup
+
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+    @classmethod
+    def build(cls, root: str, workers: int = None) -> 'EXRIndex':
+        '''Build the index of all .exr files under a directory, reading only their headers
+
+        Args:
+         - root: Root directory to walk
+         - workers: Number of threads reading the headers (Defaults to the number of CPUs)
+
+        Returns:
+         - index: The index of the files (sorted by path)
+        '''
+        paths = []
+        for directory, subdirectories, filenames in os.walk(root):
+            subdirectories.sort()
+            paths.extend(os.path.join(directory, f) for f in sorted(filenames) if f.endswith('.exr'))
+
+        def read(filepath: str) -> tuple:
+            stat = os.stat(filepath)
+            header = read_header(filepath)
+            data_window = header['dataWindow']
+            channel_set = ';'.join('{}:{}'.format(name, channel.type) for name, channel
+                                   in sorted(header['channels'].items()))
+            return (os.path.relpath(filepath, root).encode(), data_window.max.y - data_window.min.y + 1,
+                    data_window.max.x - data_window.min.x + 1, channel_set, header['compression'].v,
+                    stat.st_size, stat.st_mtime_ns)
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            rows = list(executor.map(read, paths))
+
+        columns = list(zip(*rows)) if rows else [()] * 7
+        channel_sets, channel_set_ids = np.unique(np.array(columns[3], dtype=str), return_inverse=True)
+        return cls(root, np.array(columns[0], dtype=bytes), np.array(columns[1], dtype=np.int32),
+                   np.array(columns[2], dtype=np.int32), channel_sets, channel_set_ids.astype(np.int32),
+                   np.array(columns[4], dtype=np.uint8), np.array(columns[5], dtype=np.int64),
+                   np.array(columns[6], dtype=np.int64))
+
+
+    def save(self, path: str) -> None:
+        '''Save the index to a .npz file
+
+        Args:
+         - path: Path of the index file
+        '''
+        np.savez(path, root=np.array(self.root), paths=self.paths, heights=self.heights, widths=self.widths,
+                 channel_sets=self.channel_sets, channel_set_ids=self.channel_set_ids,
+                 compressions=self.compressions, sizes=self.sizes, mtimes=self.mtimes)
+
+
+    @classmethod
+    def load(cls, path: str) -> 'EXRIndex':
+        '''Load an index saved with save
+
+        Args:
+         - path: Path of the index file
+
+        Returns:
+         - index: The loaded index
+        '''
+        with np.load(path) as data:
+            return cls(str(data['root']), data['paths'], data['heights'], data['widths'], data['channel_sets'],
+                       data['channel_set_ids'], data['compressions'], data['sizes'], data['mtimes'])
+
+
+    def filepaths(self, selection: np.ndarray = None) -> list[str]:
+        '''Get the full paths of the files
+
+        Args:
+         - selection: Indices or boolean mask of the files to get the paths of (All files if None)
+
+        Returns:
+         - filepaths: Paths of the files (joined with root)
+        '''
+        paths = self.paths if selection is None else self.paths[selection]
+        return [os.path.join(self.root, p.decode()) for p in paths]
+
+
+    def find(self, filepath: str) -> int:
+        '''Get the position of a file in the index
+
+        Args:
+         - filepath: Path of the file, relative to root, or starting with root (e.g. from filepaths), or absolute
+
+        Returns:
+         - position: Position of the file in the index (Raises KeyError if the file is not indexed)
+        '''
+        if self._positions is None:
+            self._positions = {p: i for i, p in enumerate(self.paths.tolist())}
+        filepath = os.path.normpath(filepath)
+        if os.path.isabs(filepath) or filepath.startswith(os.path.join(os.path.normpath(self.root), '')):
+            filepath = os.path.relpath(filepath, self.root)
+        return self._positions[filepath.encode()]
+
+
+    def channels(self, position: int) -> dict:
+        '''Get the channels of a file
+
+        Args:
+         - position: Position of the file in the index
+
+        Returns:
+         - channels: Dict mapping the names of the channels to their pixel types ('HALF', 'FLOAT' or 'UINT')
+        '''
+        channel_set = str(self.channel_sets[self.channel_set_ids[position]])
+        return dict(channel.split(':') for channel in channel_set.split(';')) if channel_set else {}
+
+
+    def compression(self, position: int) -> str:
+        '''Get the name of the compression of a file
+
+        Args:
+         - position: Position of the file in the index
+
+        Returns:
+         - compression: Name of the compression (e.g. 'ZIP_COMPRESSION')
+        '''
+        return str(Imath.Compression(int(self.compressions[position])))
+
+
+    def has_channels(self, channel_string: str) -> np.ndarray:
+        '''Check which files have all channels of a channel string
+
+        Args:
+         - channel_string: String describing the channels (See OpenEXRReader)
+
+        Returns:
+         - mask: Boolean array, True for the files having all channels
+        '''
+        channel_names, _ = parse_channel_string(channel_string)
+        has_set = np.array([set(channel_names) <= {c.split(':')[0] for c in channel_set.split(';')}
+                            for channel_set in self.channel_sets.tolist()], dtype=bool)
+        return has_set[self.channel_set_ids] if len(has_set) else np.zeros(len(self), dtype=bool)
+
+
+    def is_current(self, position: int) -> bool:
+        '''Check if a file is unchanged since it was indexed (by its size and modification time)
+
+        Args:
+         - position: Position of the file in the index
+
+        Returns:
+         - current: False if the file is changed or missing
+        '''
+        try:
+            stat = os.stat(self.filepaths([position])[0])
+        except FileNotFoundError:
+            return False
+        return stat.st_size == self.sizes[position] and stat.st_mtime_ns == self.mtimes[position]
+
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Build the index of the EXR files in a directory tree')
+    parser.add_argument('root', help='Root directory of the EXR files')
+    parser.add_argument('index', help='Path of the index file to write (.npz)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of threads reading the headers')
+    args = parser.parse_args()
+
+    index = EXRIndex.build(args.root, args.workers)
+    index.save(args.index)
+    print('Indexed {} files in {}'.format(len(index), args.root))
@@ -0,0 +1,291 @@
+from typing import Any
+import numpy as np
+
+
+# Largest number of possible (class, instance) keys for which a dense lookup table is used instead of sorting
+DENSE_KEY_LIMIT = 1 << 24
+
+
+def _as_ids(data: Any) -> np.ndarray:
+    '''Convert a Class ID or Instance ID channel (NumPy array, PyTorch tensor or list) to a non-negative int64 array
+    '''
+    ids = np.asarray(data)
+    if ids.dtype.kind != 'i' or ids.dtype.itemsize != 8:
+        ids = ids.astype(np.int64)
+    return ids
+
+
+def instance_labels(class_ids: Any, instance_ids: Any, ignore_class: int = 0) -> tuple[np.ndarray,np.ndarray]:
+    '''Combine the Class ID and Instance ID channels into a map of unique instance labels
+
+    Instance IDs are only unique within a class, so every (class, instance) pair gets its own label. The labels are
+    computed in one vectorized pass, with a dense lookup table for small IDs (no sorting of the pixels).
+
+    Args:
+     - class_ids: Class ID channel (exr.c, with any loader)
+     - instance_ids: Instance ID channel (exr.i, with any loader)
+     - ignore_class: Class ID of pixels that get label -1 and no entry in the table (e.g. the background).
+                     If None, all pixels are labelled.
+
+    Returns:
+     - labels: int32 array of the shape of the channels, with the label of each pixel (0 to N-1, or -1)
+     - table: (N,2) int64 array of the (class, instance) pair of each label, sorted by class then instance
+    '''
+    class_ids = _as_ids(class_ids)
+    instance_ids = _as_ids(instance_ids)
+    if class_ids.shape != instance_ids.shape:
+        raise ValueError('Class ID shape {} and Instance ID shape {} differ'.format(class_ids.shape,
+                                                                                  instance_ids.shape))
+    if class_ids.size == 0:
+        return np.full(class_ids.shape, -1, dtype=np.int32), np.zeros((0, 2), dtype=np.int64)
+    if class_ids.min() < 0 or instance_ids.min() < 0:
+        raise ValueError('Class IDs and Instance IDs must not be negative')
+
+    instance_range = int(instance_ids.max()) + 1
+    keys = class_ids * instance_range + instance_ids  # Unique key of each (class, instance) pair
+    key_range = (int(class_ids.max()) + 1) * instance_range
+
+    if key_range <= DENSE_KEY_LIMIT:
+        present = np.zeros(key_range, dtype=bool)
+        present[keys.ravel()] = True
+        if ignore_class is not None and ignore_class * instance_range < key_range:
+            present[ignore_class * instance_range:(ignore_class + 1) * instance_range] = False
+        unique_keys = np.flatnonzero(present)
+        lookup = np.full(key_range, -1, dtype=np.int32)
+        lookup[unique_keys] = np.arange(len(unique_keys), dtype=np.int32)
+        labels = lookup[keys]
+    else:
+        unique_keys, inverse = np.unique(keys.ravel(), return_inverse=True)
+        labels = inverse.astype(np.int32).reshape(keys.shape)
+        if ignore_class is not None:
+            ignored = unique_keys // instance_range == ignore_class
+            if ignored.any():
+                lookup = np.cumsum(~ignored, dtype=np.int32) - 1
+                lookup[ignored] = -1
+                labels = lookup[labels]
+                unique_keys = unique_keys[~ignored]
+
+    table = np.stack(np.divmod(unique_keys, instance_range), axis=1).astype(np.int64)
+    return labels, table
+
+
+def instance_masks(labels: np.ndarray, count: int = None) -> np.ndarray:
+    '''Create a boolean mask for every instance label
+
+    Args:
+     - labels: Label map returned by instance_labels
+     - count: Number of labels (len(table), computed from the labels if None)
+
+    Returns:
+     - masks: (N,)+labels.shape bool array, masks[n] is True where the label is n
+    '''
+    if count is None:
+        count = int(labels.max()) + 1 if labels.size else 0
+    masks = np.zeros((count,) + labels.shape, dtype=bool)
+    flat = masks.reshape(count, -1)
+    pixels = np.flatnonzero(labels.ravel() >= 0)
+    flat[labels.ravel()[pixels], pixels] = True  # One scatter instead of comparing the labels with each instance
+    return masks
+
+
+def instances(exr: Any, ignore_class: int = 0) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    '''Get the instance labels, masks and (class, instance) table of an exr object with the c and i channels loaded
+
+    Args:
+     - exr: The exr object (e.g. from OpenEXRReader(PATH, 'ci', np))
+     - ignore_class: Class ID of pixels that are not part of any instance (See instance_labels)
+
+    Returns:
+     - labels: Label map (See instance_labels)
+     - masks: Boolean mask of each label (See instance_masks)
+     - table: (class, instance) pair of each label (See instance_labels)
+
+    Usage:
+    with OpenEXRReader(PATH, 'ci', np) as exr:
+        labels, masks, table = instances(exr)
+    '''
+    labels, table = instance_labels(exr.c, exr.i, ignore_class)
+    if labels.ndim == 1:
+        labels = labels.reshape(exr.shape)  # Channels of the default loader are flat lists
+    return labels, instance_masks(labels, len(table)), table
+
+
+def instance_statistics(labels: np.ndarray, count: int = None, depth: Any = None) -> dict:
+    '''Compute the bounding box, area, centroid and mean depth of every instance label in one pass over the pixels
+
+    Instead of masking the image once per instance, the pixels are counted per (label, row) and (label, column)
+    with two bincounts. The statistics are then computed from these (N,H) and (N,W) histograms.
+
+    Args:
+     - labels: Label map returned by instance_labels (H,W)
+     - count: Number of labels (len(table), computed from the labels if None)
+     - depth: Depth channel (exr.d, with any loader). The mean depth is only computed if it is given.
+
+    Returns:
+     - statistics: Dict with the following arrays (indexed by label):
+        - 'boxes': (N,4) int32 bounding boxes (x0,y0,x1,y1), with exclusive ends (x1 = last column + 1)
+        - 'areas': (N,) int64 number of pixels
+        - 'centroids': (N,2) float64 mean pixel coordinates (x,y)
+        - 'depths': (N,) float64 mean depth (Only if depth is given)
+       Labels without pixels have an empty box at 0 and NaN centroid and depth.
+    '''
+    labels = np.asarray(labels)
+    if labels.ndim != 2:
+        raise ValueError('The labels must be a (H,W) label map, got shape {}'.format(labels.shape))
+    if count is None:
+        count = int(labels.max()) + 1 if labels.size else 0
+    height, width = labels.shape
+    bins = labels.astype(np.int64) + 1  # Bin 0 collects the unlabelled pixels (label -1)
+
+    rows = np.bincount((bins * height + np.arange(height)[:, None]).ravel(),
+                       minlength=(count + 1) * height).reshape(count + 1, height)[1:]
+    columns = np.bincount((bins * width + np.arange(width)[None, :]).ravel(),
+                          minlength=(count + 1) * width).reshape(count + 1, width)[1:]
+    areas = rows.sum(axis=1)
+    present = areas > 0
+
+    boxes = np.zeros((count, 4), dtype=np.int32)
+    occupied_rows = rows > 0
+    occupied_columns = columns > 0
+    boxes[:, 0] = np.argmax(occupied_columns, axis=1)
+    boxes[:, 1] = np.argmax(occupied_rows, axis=1)
+    boxes[:, 2] = width - np.argmax(occupied_columns[:, ::-1], axis=1)
+    boxes[:, 3] = height - np.argmax(occupied_rows[:, ::-1], axis=1)
+    boxes[~present] = 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids = np.stack((columns @ np.arange(width, dtype=np.float64),
+                              rows @ np.arange(height, dtype=np.float64)), axis=1) / areas[:, None]
+        statistics = {'boxes': boxes, 'areas': areas, 'centroids': centroids}
+        if depth is not None:
+            depth = np.asarray(depth, dtype=np.float64).reshape(labels.shape)
+            depth_sums = np.bincount(bins.ravel(), weights=depth.ravel(), minlength=count + 1)[1:]
+            statistics['depths'] = depth_sums / areas
+    return statistics
+
+
+def detections(exr: Any, ignore_class: int = 0) -> dict:
+    '''Get the detection labels (class, instance, bounding box, area, centroid and mean depth) of an exr object
+
+    Args:
+     - exr: The exr object with the c and i channels loaded (and optionally d, for the mean depth)
+     - ignore_class: Class ID of pixels that are not part of any instance (See instance_labels)
+
+    Returns:
+     - detections: Dict of the statistics of each instance (See instance_statistics), with the additional
+                   'classes' and 'instances' arrays of the Class and Instance IDs of each instance
+
+    Usage:
+    with OpenEXRReader(PATH, 'cid', np) as exr:
+        boxes = detections(exr)['boxes']
+    '''
+    labels, table = instance_labels(exr.c, exr.i, ignore_class)
+    if labels.ndim == 1:
+        labels = labels.reshape(exr.shape)  # Channels of the default loader are flat lists
+    depth = exr.d if 'd' in exr.channel_names else None
+    statistics = instance_statistics(labels, len(table), depth)
+    statistics['classes'] = table[:, 0]
+    statistics['instances'] = table[:, 1]
+    return statistics
+
+
+def _rle_string(counts: np.ndarray) -> str:
+    '''Compress RLE counts into the string format of the COCO API (pycocotools' rleToString)
+    '''
+    characters = []
+    for position, count in enumerate(counts.tolist()):
+        value = count - counts[position - 2] if position > 2 else count
+        more = True
+        while more:
+            character = value & 0x1f
+            value >>= 5
+            more = value != -1 if character & 0x10 else value != 0
+            if more:
+                character |= 0x20
+            characters.append(chr(character + 48))
+    return ''.join(characters)
+
+
+def encode_rle(labels: np.ndarray, count: int = None, compressed: bool = True) -> list[dict]:
+    '''Encode the mask of every instance label as a COCO-style run-length encoding
+
+    The column-major label image is scanned once for runs of equal labels. The runs are grouped by label, so the
+    boolean mask of an instance is never created.
+
+    Args:
+     - labels: Label map returned by instance_labels (H,W)
+     - count: Number of labels (len(table), computed from the labels if None)
+     - compressed: Compress the counts into the string format of the COCO API (Lists of run lengths if False)
+
+    Returns:
+     - rles: List of {'size': [H,W], 'counts': ...} dicts, one for each label
+    '''
+    labels = np.asarray(labels)
+    if labels.ndim != 2:
+        raise ValueError('The labels must be a (H,W) label map, got shape {}'.format(labels.shape))
+    if count is None:
+        count = int(labels.max()) + 1 if labels.size else 0
+    height, width = labels.shape
+    pixels = labels.T.ravel()  # COCO masks are column-major
+
+    starts = np.flatnonzero(np.concatenate(([True], pixels[1:] != pixels[:-1]))) if pixels.size else np.zeros(0, int)
+    ends = np.append(starts[1:], pixels.size)
+    run_labels = pixels[starts]
+
+    # Runs of each label in order of position (stable sort keeps the order within a label)
+    keep = run_labels >= 0
+    order = np.argsort(run_labels[keep], kind='stable')
+    starts, ends, run_labels = starts[keep][order], ends[keep][order], run_labels[keep][order]
+    group_starts = np.searchsorted(run_labels, np.arange(count + 1))
+
+    # Length of the gap before each run (The first run of a label starts after a gap from the first pixel)
+    previous_ends = np.concatenate(([0], ends[:-1]))
+    previous_ends[group_starts[:-1][group_starts[:-1] < len(starts)]] = 0
+    runs = np.stack((starts - previous_ends, ends - starts), axis=1)
+
+    rles = []
+    for label in range(count):
+        first, last = group_starts[label], group_starts[label + 1]
+        counts = runs[first:last].ravel()
+        trailing = pixels.size - (ends[last - 1] if last > first else 0)
+        if trailing:
+            counts = np.append(counts, trailing)
+        rles.append({'size': [height, width], 'counts': _rle_string(counts) if compressed else counts.tolist()})
+    return rles
+
+
+def decode_rle(rle: dict) -> np.ndarray:
+    '''Decode a COCO-style run-length encoding (with uncompressed counts) into a boolean mask
+
+    Args:
+     - rle: {'size': [H,W], 'counts': [...]} dict, as returned by encode_rle with compressed=False
+
+    Returns:
+     - mask: (H,W) bool array
+    '''
+    height, width = rle['size']
+    counts = np.asarray(rle['counts'], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1  # Runs alternate between False and True, starting with False
+    return np.repeat(values, counts).reshape(width, height).T
+
+
+def instance_rle(exr: Any, ignore_class: int = 0, compressed: bool = True) -> tuple[list[dict],np.ndarray]:
+    '''Get the COCO-style run-length encoded mask of every instance of an exr object with the c and i channels loaded
+
+    Args:
+     - exr: The exr object (e.g. from OpenEXRReader(PATH, 'ci', np))
+     - ignore_class: Class ID of pixels that are not part of any instance (See instance_labels)
+     - compressed: Compress the counts into the string format of the COCO API (See encode_rle)
+
+    Returns:
+     - rles: Run-length encoded mask of each label (See encode_rle)
+     - table: (class, instance) pair of each label (See instance_labels)
+
+    Usage:
+    with OpenEXRReader(PATH, 'ci', np) as exr:
+        rles, table = instance_rle(exr)
+    '''
+    labels, table = instance_labels(exr.c, exr.i, ignore_class)
+    if labels.ndim == 1:
+        labels = labels.reshape(exr.shape)  # Channels of the default loader are flat lists
+    return encode_rle(labels, len(table), compressed), table
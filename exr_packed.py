@@ -0,0 +1,228 @@
+from typing import Any, Iterable, Sequence
+import warnings
+import struct
+import json
+import zlib
+
+import numpy as np
+
+from exr_reader import OpenEXRWrapper
+from exr_batch import read_many
+
+
+MAGIC = b'EXRPACK1'
+PREAMBLE = struct.Struct('<8sQ')  # Magic and offset of the JSON footer
+ALIGNMENT = 64  # Channels are aligned to this number of bytes inside the frames
+COMPRESSIONS = (None, 'zlib')
+
+
+def _choose_dtype(integral: bool, minimum: float, maximum: float, dtype: np.dtype) -> np.dtype:
+    '''Choose the smallest data type that can store all values of a channel without loss
+
+    Args:
+     - integral: True if all values of the channel are integers
+     - minimum: Smallest value of the channel
+     - maximum: Largest value of the channel
+     - dtype: Data type the channel was loaded as
+
+    Returns:
+     - dtype: Data type to store the channel as
+    '''
+    if integral and np.isfinite(minimum) and np.isfinite(maximum):
+        for candidate in (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32):
+            info = np.iinfo(candidate)
+            if info.min <= minimum and maximum <= info.max:
+                return np.dtype(candidate)
+    return np.dtype(dtype)
+
+
+def pack(paths: Sequence[str], channel_string: str, output_path: str, chunk_frames: int = 16,
+         compression: str = None, dtypes: dict = None, workers: int = None, **reader_kwargs) -> None:
+    '''Convert EXR files into a single packed file of fixed-shape frames, that can be read without decompressing EXRs
+
+    The frames are stored one after the other, in chunks of chunk_frames frames. Without compression the file is
+    memory-mapped when read, with compression each chunk is compressed separately.
+
+    Args:
+     - paths: Paths to the exr files (All must have the same resolution)
+     - channel_string: String describing which channels to store (See OpenEXRReader)
+     - output_path: Path of the packed file to write
+     - chunk_frames: Number of frames in a chunk
+     - compression: Compression of the chunks (None or 'zlib')
+     - dtypes: Dict mapping channel keys to NumPy data types to store the channels as. The data type of the other
+               channels is chosen from the data: the smallest integer type if all values are integers (e.g. Class
+               and Instance IDs), otherwise the data type they are loaded as. Choosing it reads the files twice.
+     - workers: Number of threads decoding the EXR files
+     - reader_kwargs: Additional arguments of OpenEXRReader (e.g. roi)
+
+    Usage:
+    pack(PATHS, 'rgbcid', 'dataset.pack')
+    dataset = PackedReader('dataset.pack', np)
+    exr = dataset[0]
+    '''
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression "{}", use one of {}'.format(compression, COMPRESSIONS))
+    if 'stack' in reader_kwargs or 'out' in reader_kwargs or reader_kwargs.get('lazy'):
+        raise ValueError('pack does not support stacked output, shared output buffers (out) or lazy loading')
+    dtypes = dict(dtypes or {})
+
+    # First pass: choose the data types of the channels that have no data type given
+    stats = {}
+    for exr in read_many(paths, channel_string, np, workers, **reader_kwargs):
+        for key, data in exr.channels.items():
+            if key in dtypes:
+                continue
+            integral = bool(np.all(np.mod(data, 1) == 0)) if data.dtype.kind == 'f' else True
+            integral_, minimum, maximum, dtype = stats.get(key, (True, np.inf, -np.inf, data.dtype))
+            stats[key] = (integral and integral_, min(minimum, float(data.min())), max(maximum, float(data.max())),
+                          dtype)
+    for key, stat in stats.items():
+        dtypes[key] = _choose_dtype(*stat)
+
+    # Second pass: write the frames
+    shape = None
+    layout = []
+    chunk_offsets = []
+    chunk_sizes = []
+    frames = []
+    with open(output_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, 0))
+        f.write(b'\0' * (ALIGNMENT - PREAMBLE.size))
+        chunk = bytearray()
+        for exr in read_many(paths, channel_string, np, workers, **reader_kwargs):
+            if shape is None:
+                shape = tuple(exr.channels[exr.channel_names[0]].shape)
+                offset = 0
+                for key in exr.channel_names:
+                    layout.append((key, offset, np.dtype(dtypes[key]).str))
+                    offset += -(-int(np.prod(shape)) * np.dtype(dtypes[key]).itemsize // ALIGNMENT) * ALIGNMENT
+                frame_bytes = offset
+            frame = np.zeros(frame_bytes, dtype=np.uint8)
+            for key, offset, dtype in layout:
+                data = exr.channels[key]
+                if tuple(data.shape) != shape:
+                    raise ValueError('Frame {} has shape {}, but the frames of the packed file have shape {}'.format(
+                        exr.filepath, tuple(data.shape), shape))
+                frame[offset:offset + data.size*np.dtype(dtype).itemsize].view(dtype).reshape(shape)[...] = data
+            chunk += frame.data
+            frames.append(exr.filepath)
+
+            if len(frames) % chunk_frames == 0:
+                _write_chunk(f, chunk, compression, chunk_offsets, chunk_sizes)
+                chunk = bytearray()
+        if chunk:
+            _write_chunk(f, chunk, compression, chunk_offsets, chunk_sizes)
+
+        footer_offset = f.tell()
+        f.write(json.dumps({'channel_string': channel_string, 'layout': layout, 'shape': shape,
+                            'frame_bytes': frame_bytes if frames else 0, 'chunk_frames': chunk_frames,
+                            'compression': compression, 'chunk_offsets': chunk_offsets, 'chunk_sizes': chunk_sizes,
+                            'filepaths': frames}).encode())
+        f.seek(0)
+        f.write(PREAMBLE.pack(MAGIC, footer_offset))
+
+
+def _write_chunk(f: Any, chunk: bytearray, compression: str, chunk_offsets: list, chunk_sizes: list) -> None:
+    '''Write a chunk of frames to the packed file
+
+    Args:
+     - f: The packed file
+     - chunk: Data of the frames of the chunk
+     - compression: Compression of the chunk (None or 'zlib')
+     - chunk_offsets: Offsets of the chunks in the file (The offset of this chunk is appended)
+     - chunk_sizes: Sizes of the chunks in the file (The size of this chunk is appended)
+    '''
+    data = zlib.compress(chunk, 1) if compression == 'zlib' else chunk
+    chunk_offsets.append(f.tell())
+    chunk_sizes.append(len(data))
+    f.write(data)
+    f.write(b'\0' * (-len(data) % ALIGNMENT))  # Keep the chunks aligned
+
+
+class PackedReader():
+    '''Read frames from a file written by pack
+
+    The frames have the same attribute interface as the exr objects of OpenEXRReader (exr.r, exr.channel_names,
+    exr.resolution, ...), but the header of the EXR files is not stored (exr.header is None).
+
+    Args:
+     - path: Path of the packed file
+     - loader: Module to use to load the channel data (NumPy or PyTorch)
+
+    Usage:
+    dataset = PackedReader('dataset.pack', np)
+    for exr in dataset:
+        exr.r
+
+    Without compression, the channels are read-only views of the memory-mapped file (No data is read until they are
+    used). With compression, the chunk of the last read frame is kept decompressed in memory.
+    '''
+    def __init__(self, path: str, loader: Any = np):
+        self.path = path
+        self.loader = loader
+        with open(path, 'rb') as f:
+            magic, footer_offset = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a packed EXR file'.format(path))
+            f.seek(footer_offset)
+            self.meta = json.loads(f.read())
+        self.shape = tuple(self.meta['shape']) if self.meta['shape'] else None
+        self.channel_names = [key for key, _, _ in self.meta['layout']]
+        self.filepaths = self.meta['filepaths']
+        self._map = None
+        if self.meta['compression'] is None and self.filepaths:
+            self._map = np.memmap(path, dtype=np.uint8, mode='r', offset=0, shape=(footer_offset,))
+        self._chunk = (None, None)  # Index and data of the last decompressed chunk
+
+
+    def __len__(self) -> int:
+        return len(self.filepaths)
+
+
+    def __getitem__(self, index: int) -> OpenEXRWrapper:
+        '''Read a frame
+        '''
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Frame index {} out of range for {} frames'.format(index, len(self)))
+        frame = self._frame(index)
+        channels = {}
+        for key, offset, dtype in self.meta['layout']:
+            size = int(np.prod(self.shape)) * np.dtype(dtype).itemsize
+            data = frame[offset:offset + size].view(dtype).reshape(self.shape)
+            if self.loader is not np:
+                with warnings.catch_warnings():
+                    # PyTorch warns about non-writable arrays, the tensor is only read-only by convention there
+                    warnings.filterwarnings('ignore', message='The given NumPy array is not writable')
+                    data = self.loader.from_numpy(data)
+            channels[key] = data
+        return OpenEXRWrapper(None, self.channel_names, self.shape, channels, None, self.filepaths[index])
+
+
+    def __iter__(self) -> Iterable[OpenEXRWrapper]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+    def _frame(self, index: int) -> np.ndarray:
+        '''Get the bytes of a frame
+
+        Args:
+         - index: Index of the frame
+
+        Returns:
+         - frame: uint8 array of the data of the frame
+        '''
+        frame_bytes = self.meta['frame_bytes']
+        chunk_index, position = divmod(index, self.meta['chunk_frames'])
+        if self._map is not None:
+            offset = self.meta['chunk_offsets'][chunk_index] + position*frame_bytes
+            return self._map[offset:offset + frame_bytes]
+
+        if self._chunk[0] != chunk_index:
+            with open(self.path, 'rb') as f:
+                f.seek(self.meta['chunk_offsets'][chunk_index])
+                data = zlib.decompress(f.read(self.meta['chunk_sizes'][chunk_index]))
+            self._chunk = (chunk_index, np.frombuffer(data, dtype=np.uint8))
+        return self._chunk[1][position*frame_bytes:(position + 1)*frame_bytes]
@@ -0,0 +1,145 @@
+from functools import lru_cache
+from typing import Any
+import json
+
+import numpy as np
+
+
+# Header attributes the camera intrinsics are read from: a single attribute with a 3x3 matrix or (fx, fy, cx, cy)
+# (as a JSON string or a list), or one attribute for each of fx, fy, cx and cy
+MATRIX_ATTRIBUTES = ('intrinsics', 'K', 'cameraIntrinsics')
+FOCAL_ATTRIBUTES = ('fx', 'fy', 'cx', 'cy')
+DEPTH_TYPES = ('planar', 'radial')
+RAY_GRID_CACHE_SIZE = 16
+
+
+def _as_intrinsics(value: Any) -> tuple[float,float,float,float]:
+    '''Convert a 3x3 camera matrix or an (fx, fy, cx, cy) sequence to an (fx, fy, cx, cy) tuple
+    '''
+    if isinstance(value, (bytes, str)):
+        value = json.loads(value)
+    value = np.asarray(value, dtype=np.float64)
+    if value.shape == (3, 3):
+        return float(value[0, 0]), float(value[1, 1]), float(value[0, 2]), float(value[1, 2])
+    if value.shape == (4,):
+        return tuple(float(v) for v in value)
+    raise ValueError('Intrinsics must be a 3x3 camera matrix or (fx, fy, cx, cy), got shape {}'.format(value.shape))
+
+
+def header_intrinsics(header: dict) -> tuple[float,float,float,float]:
+    '''Read the camera intrinsics from the attributes of an EXR header
+
+    Args:
+     - header: Header of the exr file (e.g. exr.header or read_header(PATH))
+
+    Returns:
+     - intrinsics: (fx, fy, cx, cy) in pixels, or None if the header has no intrinsics (See MATRIX_ATTRIBUTES and
+                   FOCAL_ATTRIBUTES)
+    '''
+    for name in MATRIX_ATTRIBUTES:
+        if name in header:
+            return _as_intrinsics(header[name])
+    if all(name in header for name in FOCAL_ATTRIBUTES):
+        return tuple(float(header[name]) for name in FOCAL_ATTRIBUTES)
+    return None
+
+
+@lru_cache(maxsize=RAY_GRID_CACHE_SIZE)
+def ray_grid(height: int, width: int, intrinsics: tuple[float,float,float,float],
+             depth_type: str = 'planar') -> np.ndarray:
+    '''Get the ray of every pixel, that is multiplied by the depth of the pixel to get its 3D point
+
+    The grid is cached per resolution, intrinsics and depth type, so it is only computed once for a sequence of frames.
+
+    Args:
+     - height: Height of the image
+     - width: Width of the image
+     - intrinsics: (fx, fy, cx, cy) in pixels
+     - depth_type: 'planar' if the depth is the distance along the optical axis (the rays have z=1), 'radial' if it
+                   is the distance from the camera center (the rays have unit length)
+
+    Returns:
+     - rays: Read-only (H*W,3) float32 array of the rays in camera coordinates (x right, y down, z forward)
+    '''
+    if depth_type not in DEPTH_TYPES:
+        raise ValueError('Unknown depth type "{}", use one of {}'.format(depth_type, DEPTH_TYPES))
+    fx, fy, cx, cy = intrinsics
+    rays = np.empty((height, width, 3), dtype=np.float64)
+    rays[..., 0] = (np.arange(width) - cx) / fx
+    rays[..., 1] = ((np.arange(height) - cy) / fy)[:, None]
+    rays[..., 2] = 1
+    if depth_type == 'radial':
+        rays /= np.linalg.norm(rays, axis=2, keepdims=True)
+    rays = rays.astype(np.float32).reshape(-1, 3)
+    rays.flags.writeable = False  # Shared by all callers of the cache
+    return rays
+
+
+def backproject(depth: Any, intrinsics: Any, max_depth: float = None, depth_type: str = 'planar',
+                out: np.ndarray = None, resolution: tuple[int,int] = None, window: tuple = None) -> np.ndarray:
+    '''Back-project a depth map into a point cloud in camera coordinates
+
+    Args:
+     - depth: Depth channel (H,W) (exr.d, with the NumPy or PyTorch loader)
+     - intrinsics: 3x3 camera matrix or (fx, fy, cx, cy) in pixels (pixel (0,0) is at x=0, y=0)
+     - max_depth: Only keep the points closer than this (e.g. to remove the background). All H*W points if None.
+     - depth_type: 'planar' or 'radial' (See ray_grid)
+     - out: (H*W,3) float32 array to write the points into (Reused between frames, only if max_depth is None)
+     - resolution: Resolution of the whole image (height,width), if the depth is a region of it (See window)
+     - window: Region (y0,y1,x0,x1) of the image the depth was loaded from (exr.window). The rays of the region
+               are a view of the cached rays of the whole image, so any region reuses the same grid.
+
+    Returns:
+     - points: (N,3) float32 array of the points (x right, y down, z forward), in row-major pixel order
+    '''
+    depth = np.asarray(depth)
+    if depth.ndim != 2:
+        raise ValueError('The depth must be a (H,W) array, got shape {}'.format(depth.shape))
+    height, width = resolution if window is not None else depth.shape
+    y0, y1, x0, x1 = window if window is not None else (0, height, 0, width)
+    if depth.shape != (y1 - y0, x1 - x0):
+        raise ValueError('The depth has shape {}, the window {} has shape {}'.format(
+            depth.shape, tuple(window), (y1 - y0, x1 - x0)))
+    rays = ray_grid(height, width, _as_intrinsics(intrinsics), depth_type).reshape(height, width, 3)[y0:y1, x0:x1]
+    depth = depth[..., None]
+    if max_depth is not None:
+        if out is not None:
+            raise ValueError('out can only be used without max_depth, as the number of points is not known')
+        keep = depth[..., 0] < max_depth
+        return np.multiply(rays[keep], depth[keep], dtype=np.float32)
+    if out is not None:
+        if out.shape != (depth.size, 3) or not out.flags.c_contiguous:
+            raise ValueError('out must be a contiguous ({},3) array, got shape {}'.format(depth.size, out.shape))
+        np.multiply(rays, depth, out=out.reshape(rays.shape), dtype=np.float32)  # Writes into out (a view)
+        return out
+    return np.multiply(rays, depth, dtype=np.float32).reshape(-1, 3)
+
+
+def point_cloud(exr: Any, intrinsics: Any = None, max_depth: float = None, depth_type: str = 'planar',
+                out: np.ndarray = None) -> np.ndarray:
+    '''Back-project the depth channel of an exr object into a point cloud in camera coordinates
+
+    Args:
+     - exr: The exr object with the d channel loaded (NumPy or PyTorch loader)
+     - intrinsics: 3x3 camera matrix or (fx, fy, cx, cy) in pixels of the whole image. Read from the header if
+                   None (See header_intrinsics). If a region of interest was loaded, the rays of its pixels are used
+                   (exr.window), so the points are in the same camera coordinates.
+     - max_depth: Only keep the points closer than this (See backproject)
+     - depth_type: 'planar' or 'radial' (See ray_grid)
+     - out: (H*W,3) float32 array to write the points into (See backproject)
+
+    Returns:
+     - points: (N,3) float32 array of the points
+
+    Usage:
+    with OpenEXRReader(PATH, 'd', np) as exr:
+        points = point_cloud(exr, (fx, fy, cx, cy), max_depth=1e9)
+    '''
+    if intrinsics is None:
+        intrinsics = header_intrinsics(exr.header or {})
+        if intrinsics is None:
+            raise ValueError('The header of {} has no camera intrinsics, pass them as intrinsics'.format(exr.filepath))
+    depth = exr.d
+    if isinstance(depth, list):
+        depth = np.array(depth, dtype=np.float32).reshape(exr.shape)  # Channels of the default loader are lists
+    return backproject(depth, intrinsics, max_depth, depth_type, out, exr.resolution, exr.window)
@@ -1,28 +1,216 @@
 import OpenEXR
+import Imath
 from dataclasses import dataclass
 from typing import Any
 from array import array
+import functools
 import copy
+import os
+import warnings
+
+
+# Names of the loader data types and array.array type codes for the pixel types of EXR channels
+LOADER_DTYPES = {Imath.PixelType.UINT: 'uint32', Imath.PixelType.HALF: 'float16', Imath.PixelType.FLOAT: 'float32'}
+# Data types of the PyTorch loader that differ from LOADER_DTYPES (Most PyTorch operations do not support uint32)
+TORCH_DTYPES = {Imath.PixelType.UINT: 'int64'}
+ARRAY_TYPECODES = {Imath.PixelType.UINT: 'I', Imath.PixelType.FLOAT: 'f'}
+# Collection of characters that start a two character expression of the channel string
+TWO_CHAR_EXPR_STARTS = 'nfm'
+# Collection of characters that map to image channels (accessed through R,G,B,A instead of X,Y,Z,W)
+IMG_TWO_CHAR_EXPR_STARTS = 'fm'
+# Number of headers kept in memory by read_header
+HEADER_CACHE_SIZE = 4096
+
+
+class MissingChannelError(TypeError):
+    '''Raised if channels requested by the channel string are not in the EXR file
+
+    (Subclass of TypeError, which was raised by OpenEXR for missing channels before)
+
+    Args:
+     - filepath: Path to the exr file
+     - channel_names: Names of the missing channels
+     - channel_keys: Keys of the missing channels
+    '''
+    def __init__(self, filepath: str, channel_names: list[str], channel_keys: list[str]):
+        self.filepath = filepath
+        self.channel_names = channel_names
+        self.channel_keys = channel_keys
+        super().__init__('Channel(s) {} (key(s) "{}") missing from file {}'.format(
+            ', '.join(channel_names), ''.join(channel_keys), filepath))
+
+
+def read_header(filepath: str) -> dict:
+    '''Read the header of an EXR file without decoding any channel
+
+    Headers are cached by the path, modification time and size of the file, so reading the header of an unchanged
+    file again does not open it.
+
+    Args:
+     - filepath: Path to the exr file
+
+    Returns:
+     - header: Header of the EXR file (channels with pixel types, dataWindow, compression, ...). It is a copy of
+               the cached header, so it can be modified.
+    '''
+    stat = os.stat(filepath)
+    # Deep copy, so modifying the header (e.g. its channels) does not change the cached header
+    return copy.deepcopy(_read_header(os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size))
+
+
+@functools.lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _read_header(filepath: str, mtime_ns: int, size: int) -> dict:
+    '''Read the header of an EXR file (mtime_ns and size are only used as keys of the cache)
+    '''
+    inputfile = OpenEXR.InputFile(filepath)
+    try:
+        return inputfile.header()
+    finally:
+        inputfile.close()
+
+
+def parse_channel_string(channel_string: str) -> tuple[list[str],list[str]]:
+    '''Parse the channel string and return a tuple containing the list of channel names and channel keys
+
+    Only parses the string (See OpenEXRReader for the codes), no file is opened.
+
+    Args:
+     - channel_string: Channel string to parse
+
+    Returns:
+     - channel_map: Tuple containing names of channels to load and corresponding keys
+    '''
+
+    char_store = ''  # Used for storing the first character for expression with two characters
+    channel_selector = ''  # Used for storing the channel name
+    channel_names = []  # List of channel names
+    channel_keys = []  # List of channel keys
+
+    for char in channel_string:
+        # Map characters to channel names
+        if char == 'c':
+            channel_selector = 'ClassID.V'
+        if char == 'i':
+            channel_selector = 'InstanceID.V'
+        if char == 'r':
+            channel_selector = 'Image.R'
+        if char == 'g':
+            channel_selector = 'Image.G'
+        if char == 'b':
+            channel_selector = 'Image.B'
+        if char == 'a':
+            channel_selector = 'Image.A'
+        if char == 'd':
+            channel_selector = 'Depth.V'
+        if char == 'n':
+            channel_selector = 'Normal'
+        if char == 'f':
+            channel_selector = 'Flow'
+        if char == 'm':
+            channel_selector = 'DistortionMap'
+
+        # Store character if it is the start of a two character expression
+        if char in TWO_CHAR_EXPR_STARTS:
+            char_store = char
+        # Finish two character expression
+        elif char_store:
+            if char == 'x':
+                if not char_store in IMG_TWO_CHAR_EXPR_STARTS:
+                    channel_selector += '.X'
+                else:
+                    channel_selector += '.G'  # Horizontal coordinates are stored in the second channel because images are handled as (height,width,channels) shaped arrays
+            if char == 'y':
+                if not char_store in IMG_TWO_CHAR_EXPR_STARTS:
+                    channel_selector += '.Y'
+                else:
+                    channel_selector += '.R'  # Vertical coordinates are stored in the first channel because images are handled as (height,width,channels) shaped arrays
+            if char == 'z':
+                if not char_store in IMG_TWO_CHAR_EXPR_STARTS:
+                    channel_selector += '.Z'
+                else:
+                    channel_selector += '.B'
+            if char == 'w':
+                if not char_store in IMG_TWO_CHAR_EXPR_STARTS:
+                    channel_selector += '.W'
+                else:
+                    channel_selector += '.A'
+
+            channel_names.append(channel_selector)
+            channel_keys.append(char_store+char)
+            channel_selector = ''
+            char_store = ''
+        # Finish expression
+        elif channel_selector and not char_store:
+            channel_names.append(channel_selector)
+            channel_keys.append(char)
+            channel_selector = ''
+            char_store = ''
+
+    channel_map = (channel_names, channel_keys)
+    return channel_map
+
 
 
-@dataclass
 class OpenEXRWrapper:
     '''Wrapper for OpenEXR.InputFile
 
+    The loaded channels can be accessed as attributes, using their keys.
+
     Args:
      - inputfile: The OpenEXR.InputFile object
      - channel_names: List of names for accessing channels
      - resolution: Resolution of the image (height,width)
+     - channels: Dict mapping channel keys to the loaded channel data
+     - header: Header of the EXR file (Stays available after the file is closed)
+     - filepath: Path to the exr file
+     - stacked: All loaded channels in a single array/tensor (only if the reader was used with a stack layout)
+     - load_channel: Function decoding a channel given its key (only for lazy readers)
+     - shape: Shape of the loaded channels (height,width), smaller than the resolution if a region of interest was
+              loaded (The resolution if None)
+     - window: Loaded region of the image (y0,y1,x0,x1), its offset (y0,x0) is the position of pixel (0,0) of the
+               channels in the image (The whole image if None)
     '''
-    inputfile: OpenEXR.InputFile
-    channel_names: list
-    resolution: tuple
+    __slots__ = ('inputfile', 'channel_names', 'resolution', 'channels', '_header', 'filepath', 'stacked',
+                 'load_channel', 'shape', 'window')
+
+    def __init__(self, inputfile: OpenEXR.InputFile, channel_names: list, resolution: tuple, channels: dict,
+                 header: dict, filepath: str = None, stacked: Any = None, load_channel: Any = None,
+                 shape: tuple = None, window: tuple = None):
+        self.inputfile = inputfile
+        self.channel_names = channel_names
+        self.resolution = resolution
+        self.shape = tuple(shape) if shape is not None else resolution
+        if window is None and resolution is not None:
+            window = (0, resolution[0], 0, resolution[1])
+        self.window = window
+        self.channels = channels
+        self._header = header
+        self.filepath = filepath
+        self.stacked = stacked
+        self.load_channel = load_channel
+
+    def __getattr__(self, name: str) -> Any:
+        '''Get a channel by its key (Only called if the attribute is not found otherwise)
+        '''
+        if name not in self.__slots__:
+            if name in self.channels:
+                return self.channels[name]
+            # Decode the channels of lazy readers on first access (They are cached in self.channels)
+            if self.load_channel is not None and name in self.channel_names:
+                return self.load_channel(name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def __dir__(self) -> list:
+        return sorted(set(super().__dir__()) | set(self.channel_names))
+
+    def __repr__(self) -> str:
+        return '{}(channel_names={}, resolution={})'.format(type(self).__name__, self.channel_names, self.resolution)
 
     @property
     def header(self) -> dict:
         '''Get the header of the EXR file
         '''
-        return self.inputfile.header()
+        return self._header
 
 
 
@@ -34,7 +222,37 @@ class OpenEXRReader():
      - filepath: Path to the exr file
      - channel_string: String describing which channels to load
      - loader: Module to use to load the channel data (Values types will depend on the loader!)
-     - resolution: Resolution of the image (height,width)
+     - resolution: Resolution of the image (height,width). If None (default), it is read from the dataWindow of the
+                   header. If given, it is checked against the header.
+     - writable: If False (default), NumPy/PyTorch channels are views of the decoded bytes (no copy). NumPy arrays
+                 are read-only, PyTorch tensors can not be made read-only and must not be modified in place (it
+                 would write into the immutable bytes object). If True, the decoded bytes are copied so the
+                 channels can be modified in place.
+     - out: Preallocated, caller-owned output for the channels (NumPy or PyTorch loader only). Can be a dict
+            mapping channel keys to arrays/tensors, or anything indexable by the position of the channel in the
+            channel string, such as a list of arrays or one (C,H,W) shaped array/tensor.
+            The channels are decoded into these buffers and the attributes of the exr object will be the buffers.
+            Each slot must have the shape of the channels (height,width) or be flat (height*width,).
+     - stack: Layout for loading all channels into a single contiguous array/tensor (NumPy or PyTorch loader only).
+              'chw' for (channels,height,width) and 'hwc' for (height,width,channels), in the order of the channel
+              string. The array/tensor is available as exr.stacked and the channel attributes are views into it.
+              If out is also given, it is used as the stacked array/tensor.
+     - dtypes: Dict mapping channel keys to loader data types to convert the channels to (e.g. {'c': np.uint8}).
+               Channels not in the dict keep the data type matching their pixel type in the file
+               (HALF: float16, FLOAT: float32, UINT: uint32, or int64 with PyTorch, which has almost no uint32
+               operations). With the default loader HALF channels are loaded as
+               FLOAT. With out, the data type of the output buffers is used instead.
+     - roi: Region of interest (y0,y1,x0,x1) to load, in pixels from the top left corner of the data window
+            (y1 and x1 are exclusive, like in slicing). Only the scanlines from y0 to y1 are decoded and the channels
+            are cropped to the region, so their shape is (y1-y0,x1-x0). If None (default), the whole image is loaded.
+     - lazy: If True, channels are only decoded when they are first accessed as attributes of the exr object
+             (which has to happen inside the with statement, a ValueError is raised afterwards). Can not be
+             combined with stack.
+     - missing: What to do with channels that are not in the file, checked before decoding anything:
+                'raise' (default) raises MissingChannelError, 'skip' leaves them out (like if they were not in the
+                channel string) and 'zeros' loads them as zeros (A read-only broadcast constant unless writable).
+     - cache: Cache of decoded channels (e.g. exr_cache.ChannelCache) shared between readers. Channels found in
+              the cache are not decoded again, decoded channels are added to it.
 
     Usage:
     with OpenEXRReader(PATH, CHSTR) as exr:
@@ -77,49 +295,156 @@ class OpenEXRReader():
     filepath: str
     channel_string: str
     loader: Any = None
-    resolution: tuple[int,int] = (1080,1920)
+    resolution: tuple[int,int] = None
+    writable: bool = False
+    out: Any = None
+    stack: str = None
+    dtypes: dict = None
+    roi: tuple[int,int,int,int] = None
+    lazy: bool = False
+    missing: str = 'raise'
+    cache: Any = None
 
 
     def __post_init__(self):
         '''This will be called at the end of the __init__ method
         '''
         self.channels = {}
-        self.two_char_expr_starts = 'nfm'  # Collection of characters that start a two character expression
-        self.img_two_char_expr_starts = 'fm'  # Collection of characters that map to image channels (accessed through R,G,B,A instead of X,Y,Z,W)
+        self.two_char_expr_starts = TWO_CHAR_EXPR_STARTS
+        self.img_two_char_expr_starts = IMG_TWO_CHAR_EXPR_STARTS
 
         # Parse channel string to know which channels to load
         self.channel_names, self.channel_keys = self._parse_channel_string(self.channel_string)
 
+        if self.missing not in ('raise', 'skip', 'zeros'):
+            raise ValueError('Unknown missing channel policy "{}", use "raise", "skip" or "zeros"'.format(self.missing))
+        if self.out is not None and not self.loader:
+            raise ValueError('Preallocated output buffers (out) require NumPy or PyTorch as the loader')
+        if self.stack is not None:
+            if self.stack not in ('chw', 'hwc'):
+                raise ValueError('Unknown stack layout "{}", use "chw" or "hwc"'.format(self.stack))
+            if not self.loader:
+                raise ValueError('Stacked output requires NumPy or PyTorch as the loader')
+            if self.lazy:
+                raise ValueError('Stacked output can not be loaded lazily')
+
 
     def __enter__(self) -> OpenEXRWrapper:
         '''Defines what should be returned if the object is used in a with statement
         '''
         # Create the OpenEXR.InputFile object
         self.inputfile = OpenEXR.InputFile(self.filepath)
-        # Load the required channels (They will be stored in self.channels)
-        self._load_channels(self.channel_names, self.channel_keys)
-
-        # Create metaclass to dinamically add attributes to the OpenEXRWrapper class
-        # The added attributes will be the loaded channels
-        class OpenEXRMeta(type):
-            def __new__(cls, name, bases, dct):
-                for k,v in self.channels.items():
-                    dct[k] = v
-                x = super().__new__(cls, name, bases, dct)
-                return x
-
-        # Create an implementation of the OpenEXRWrapper using the metaclass
-        class OpenExRWrapperIpl(OpenEXRWrapper,metaclass=OpenEXRMeta):
-            pass 
-        
-        # Return an instance of this implementation
-        return OpenExRWrapperIpl(self.inputfile, self.channel_keys, self.resolution)
+        self.closed = False
+        try:
+            self.header = self.inputfile.header()
+            self.resolution = self._read_resolution(self.header)
+            self.window = self._read_window()
+            self.shape = (self.window[1] - self.window[0], self.window[3] - self.window[2])  # Shape of the channels
+            if self.cache is not None:
+                # Identify the file by its path, modification time and size, so modified files are not read from cache
+                stat = os.stat(self.filepath)
+                self.file_id = (os.path.abspath(self.filepath), stat.st_mtime_ns, stat.st_size)
+            missing = self._check_channels()
+            if self.stack is not None and self.out is None:
+                self.out = self._allocate_stacked()
+            for channel_key in missing:
+                self._store_channel(channel_key, self._zeros(channel_key))
+            # Load the required channels (They will be stored in self.channels)
+            if not self.lazy:
+                self._load_channels(self.channel_names, self.channel_keys)
+        except BaseException:
+            # __exit__ is not called if __enter__ fails, close the file here (e.g. after a MissingChannelError)
+            self.__exit__(None, None, None)
+            raise
+
+        return OpenEXRWrapper(self.inputfile, self.channel_keys, self.resolution, self.channels, self.header,
+                              self.filepath, self.out if self.stack is not None else None,
+                              self._load_channel if self.lazy else None, self.shape, self.window)
 
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         '''Defines what should happen when we leave the with statement
         '''
         self.inputfile.close()
+        self.closed = True  # Decoding from the closed file would crash OpenEXR
+
+
+    def probe(self) -> dict:
+        '''Read the header of the EXR file without decoding any channel (See read_header)
+
+        Returns:
+         - header: Header of the EXR file
+        '''
+        return read_header(self.filepath)
+
+
+    def _check_channels(self) -> list[str]:
+        '''Check if the channels to load are in the file and apply the missing channel policy (self.missing)
+
+        Returns:
+         - missing: Keys of the missing channels to load as zeros
+        '''
+        available = self.header['channels']
+        missing = [(n,k) for n,k in zip(self.channel_names, self.channel_keys) if n not in available]
+        if not missing:
+            return []
+        if self.missing == 'raise':
+            raise MissingChannelError(self.filepath, [n for n,_ in missing], [k for _,k in missing])
+        if self.missing == 'skip':
+            found = [(n,k) for n,k in zip(self.channel_names, self.channel_keys) if n in available]
+            self.channel_names, self.channel_keys = [n for n,_ in found], [k for _,k in found]
+            return []
+        return [k for _,k in missing]
+
+
+    def _zeros(self, channel_key: str) -> Any:
+        '''Create the data of a channel filled with zeros (for missing channels)
+
+        Args:
+         - channel_key: Key of the channel
+
+        Returns:
+         - data: Zeros in the shape of the channels (A read-only broadcast view of a single zero, unless writable)
+        '''
+        if not self.loader:
+            return [0.0] * (self.shape[0] * self.shape[1])
+        dtype = self.dtypes.get(channel_key, self.loader.float32) if self.dtypes else self.loader.float32
+        if self.writable:
+            return self.loader.zeros(self.shape, dtype=dtype)
+        return self.loader.broadcast_to(self.loader.zeros((), dtype=dtype), self.shape)
+
+
+    def _read_resolution(self, header: dict) -> tuple[int,int]:
+        '''Get the resolution of the image from the dataWindow of the header and check it against self.resolution
+
+        Args:
+         - header: Header of the EXR file
+
+        Returns:
+         - resolution: Resolution of the image (height,width)
+        '''
+        data_window = header['dataWindow']
+        resolution = (data_window.max.y - data_window.min.y + 1, data_window.max.x - data_window.min.x + 1)
+        if self.resolution is not None and tuple(self.resolution) != resolution:
+            raise ValueError('Resolution {} does not match the resolution {} of file {}'.format(
+                tuple(self.resolution), resolution, self.filepath))
+        return resolution
+
+
+    def _read_window(self) -> tuple[int,int,int,int]:
+        '''Get the region of the image to load (self.roi or the whole image) and check it against self.resolution
+
+        Returns:
+         - window: Region of the image to load (y0,y1,x0,x1)
+        '''
+        height, width = self.resolution
+        if self.roi is None:
+            return (0, height, 0, width)
+        y0, y1, x0, x1 = self.roi
+        if not (0 <= y0 < y1 <= height and 0 <= x0 < x1 <= width):
+            raise ValueError('Region of interest {} is out of the bounds of file {} with resolution {}'.format(
+                tuple(self.roi), self.filepath, self.resolution))
+        return (y0, y1, x0, x1)
 
 
     def _parse_channel_string(self, channel_string: str) -> tuple[list[str],list[str]]:
@@ -129,76 +454,9 @@ class OpenEXRReader():
          - channel_string: Channel string to parse
 
         Returns:
-         - channel_map: Tuple containing names of channels to load and corresponding keys
-        '''
-
-        char_store = ''  # Used for storing the first character for expression with two characters
-        channel_selector = ''  # Used for storing the channel name
-        channel_names = []  # List of channel names
-        channel_keys = []  # List of channel keys
-
-        for char in channel_string:
-            # Map characters to channel names
-            if char == 'c':
-                channel_selector = 'ClassID.V'
-            if char == 'i':
-                channel_selector = 'InstanceID.V'
-            if char == 'r':
-                channel_selector = 'Image.R'
-            if char == 'g':
-                channel_selector = 'Image.G'
-            if char == 'b':
-                channel_selector = 'Image.B'
-            if char == 'a':
-                channel_selector = 'Image.A'
-            if char == 'd':
-                channel_selector = 'Depth.V'
-            if char == 'n':
-                channel_selector = 'Normal'
-            if char == 'f':
-                channel_selector = 'Flow'
-            if char == 'm':
-                channel_selector = 'DistortionMap'
-
-            # Store character if it is the start of a two character expression
-            if char in self.two_char_expr_starts:
-                char_store = char
-            # Finish two character expression
-            elif char_store:
-                if char == 'x':
-                    if not char_store in self.img_two_char_expr_starts:
-                        channel_selector += '.X'
-                    else:
-                        channel_selector += '.G'  # Horizontal coordinates are stored in the second channel because images are handled as (height,width,channels) shaped arrays
-                if char == 'y':
-                    if not char_store in self.img_two_char_expr_starts:
-                        channel_selector += '.Y'
-                    else:
-                        channel_selector += '.R'  # Vertical coordinates are stored in the first channel because images are handled as (height,width,channels) shaped arrays
-                if char == 'z':
-                    if not char_store in self.img_two_char_expr_starts:
-                        channel_selector += '.Z'
-                    else:
-                        channel_selector += '.B'
-                if char == 'w':
-                    if not char_store in self.img_two_char_expr_starts:
-                        channel_selector += '.W'
-                    else:
-                        channel_selector += '.A'
-                
-                channel_names.append(channel_selector)
-                channel_keys.append(char_store+char)
-                channel_selector = ''
-                char_store = ''
-            # Finish expression
-            elif channel_selector and not char_store:
-                channel_names.append(channel_selector)
-                channel_keys.append(char)
-                channel_selector = ''
-                char_store = ''
-
-        channel_map = (channel_names, channel_keys)
-        return channel_map
+         - channel_map: Tuple containing names of channels to load and corresponding keys (See parse_channel_string)
+        '''
+        return parse_channel_string(channel_string)
 
 
     def _load_channels(self, channel_names: list[str], channel_keys:list[str]) -> None:
@@ -209,14 +467,273 @@ class OpenEXRReader():
          - channel_keys: Keys under which the channel data values will be stored in self.channels
         '''
         # Only load channels that are not loaded yet
-        channel_names = [c for c in channel_names if c not in self.channels]
-
-        if channel_names:
-            channels = self.inputfile.channels(channel_names)  # Get channel values as a list of bytes objects
-            # Load data and store it in self.channels
-            for channel, channel_key in zip(channels, channel_keys):
-                if not self.loader:
-                    self.channels[channel_key] = array('f', channel).tolist()
+        to_load = [(n,k) for n,k in zip(channel_names, channel_keys) if k not in self.channels]
+
+        # Get the channels found in the cache from there
+        if self.cache is not None:
+            missing = []
+            for channel_name, channel_key in to_load:
+                data = self.cache.get(self._cache_key(channel_name, channel_key))
+                if data is None:
+                    missing.append((channel_name, channel_key))
                 else:
-                    ch_copy = bytearray(channel)
-                    self.channels[channel_key] = self.loader.frombuffer(ch_copy, dtype=self.loader.float32)
+                    self._store_channel(channel_key, self._from_cache(data, channel_name, channel_key), cached=True)
+            to_load = missing
+
+        if to_load:
+            # Group the channels by pixel type, so each group is decoded with one call in its native type
+            groups = {}
+            for channel_name, channel_key in to_load:
+                groups.setdefault(self._pixel_type(channel_name), []).append((channel_name, channel_key))
+
+            # Only decode the scanlines of the region to load (scanlines are numbered in the data window)
+            y_min = self.header['dataWindow'].min.y
+            scanlines = (y_min + self.window[0], y_min + self.window[1] - 1)
+
+            for pixel_type, group in groups.items():
+                channel_names, channel_keys = zip(*group)
+                # Get channel values as a list of bytes objects
+                channels = self.inputfile.channels(list(channel_names), Imath.PixelType(pixel_type), *scanlines)
+                # Load data and store it in self.channels
+                for channel, channel_name, channel_key in zip(channels, channel_names, channel_keys):
+                    if not self.loader:
+                        data = self._tolist(channel, pixel_type)
+                    else:
+                        # Copy for writable channels here only if the data is not copied anyway later
+                        writable = self.writable and self.out is None and self.cache is None
+                        data = self._frombuffer(channel, getattr(self.loader, LOADER_DTYPES[pixel_type]), writable)
+                        if self.out is None and self.dtypes and channel_key in self.dtypes:
+                            data = self.loader.asarray(data, dtype=self.dtypes[channel_key])
+                        elif self.out is None and self._loader_dtype(pixel_type) != LOADER_DTYPES[pixel_type]:
+                            data = self.loader.asarray(data, dtype=getattr(self.loader, self._loader_dtype(pixel_type)))
+                    if self.cache is not None:
+                        # Copy the columns of a cropped region, so the cache does not keep the full rows alive
+                        if hasattr(data, 'setflags'):
+                            if not data.flags.c_contiguous:
+                                data = data.copy()
+                            data.setflags(write=False)  # Shared by all readers of the cache (e.g. after dtypes)
+                        elif self.loader:
+                            data = data.contiguous()
+                        self.cache.put(self._cache_key(channel_name, channel_key), data)
+                    self._store_channel(channel_key, data, cached=self.cache is not None)
+
+
+    def _store_channel(self, channel_key: str, data: Any, cached: bool = False) -> None:
+        '''Store the data of a channel in self.channels (or in its slot of self.out)
+
+        Args:
+         - channel_key: Key of the channel
+         - data: Data of the channel
+         - cached: True if the data is also stored in the cache (It is copied if it could be modified: for writable
+                   readers and for PyTorch tensors, which can not be made read-only)
+        '''
+        if self.out is not None:
+            target = self._out_slot(channel_key)
+            shape = tuple(target.shape)
+            if shape == (self.shape[0] * self.shape[1],):
+                data = self.loader.reshape(data, shape)  # Flat output slots are allowed
+            elif shape != self.shape:
+                raise ValueError('Output slot of channel {} has shape {}, expected {} or ({},)'.format(
+                    channel_key, shape, self.shape, self.shape[0] * self.shape[1]))
+            target[...] = data  # Single copy, cast to the dtype of target
+            data = target
+        elif cached and not self.loader:
+            data = list(data)
+        elif cached and self.writable:
+            data = copy.deepcopy(data)
+        elif cached and not hasattr(data, 'setflags'):
+            data = data.clone()
+        self.channels[channel_key] = data
+
+
+    def _from_cache(self, data: Any, channel_name: str, channel_key: str) -> Any:
+        '''Convert the data of a channel returned by the cache to the type of the loader
+
+        The cache is shared by readers with any loader, so the data can be a list, a NumPy array (e.g. from a
+        DiskChannelCache) or a PyTorch tensor. Lists are copied, arrays and tensors are converted without copying.
+
+        Args:
+         - data: Data of the channel
+         - channel_name: Name of the channel
+         - channel_key: Key of the channel
+
+        Returns:
+         - data: Data of the channel in the type of the loader
+        '''
+        if not self.loader:
+            return data if isinstance(data, list) else data.reshape(-1).tolist()
+        if isinstance(data, list):
+            if self.out is None and self.dtypes and channel_key in self.dtypes:
+                dtype = self.dtypes[channel_key]
+            else:
+                dtype = getattr(self.loader, self._loader_dtype(self._pixel_type(channel_name)))
+            data = self.loader.asarray(data, dtype=dtype)
+        elif hasattr(self.loader, 'from_numpy') and hasattr(data, 'setflags'):  # NumPy array for the PyTorch loader
+            with warnings.catch_warnings():
+                # PyTorch warns about non-writable arrays, cached tensors are copied by _store_channel
+                warnings.filterwarnings('ignore', message='The given NumPy array is not writable')
+                data = self.loader.from_numpy(data)
+        elif not hasattr(self.loader, 'from_numpy') and not hasattr(data, 'setflags'):  # Tensor for NumPy
+            data = data.numpy()
+            data.setflags(write=False)  # Shared by all readers of the cache
+        return self.loader.reshape(data, self.shape)  # Lists and arrays of the default loader are flat
+
+
+    def _cache_key(self, channel_name: str, channel_key: str) -> tuple:
+        '''Get the key of a channel in the cache
+
+        Args:
+         - channel_name: Name of the channel
+         - channel_key: Key of the channel
+
+        Returns:
+         - key: File, channel, data type and region of the channel (Not the loader, see _from_cache)
+        '''
+        if self.out is None and self.dtypes and channel_key in self.dtypes:
+            dtype = str(self.dtypes[channel_key])
+        else:
+            dtype = self._loader_dtype(self._pixel_type(channel_name))
+        return self.file_id + (channel_name, dtype, self.window)
+
+
+    def _load_channel(self, channel_key: str) -> Any:
+        '''Load a single channel (if it is not loaded yet) and return its data
+
+        Args:
+         - channel_key: Key of the channel
+
+        Returns:
+         - data: Data of the channel
+        '''
+        if self.closed and channel_key not in self.channels:
+            raise ValueError('Channel "{}" of lazy reader of {} was not accessed inside the with statement and can '
+                             'not be decoded from the closed file'.format(channel_key, self.filepath))
+        channel_name = self.channel_names[self.channel_keys.index(channel_key)]
+        self._load_channels([channel_name], [channel_key])
+        return self.channels[channel_key]
+
+
+    def _pixel_type(self, channel_name: str) -> int:
+        '''Get the pixel type a channel should be decoded as
+
+        Args:
+         - channel_name: Name of the channel
+
+        Returns:
+         - pixel_type: Pixel type of the channel in the file (Imath.PixelType value), HALF is decoded as FLOAT
+                       with the default loader. FLOAT if the channel is not in the file.
+        '''
+        channel = self.header['channels'].get(channel_name)
+        if channel is None:
+            return Imath.PixelType.FLOAT
+        if not self.loader and channel.type.v == Imath.PixelType.HALF:
+            return Imath.PixelType.FLOAT
+        return channel.type.v
+
+
+    def _loader_dtype(self, pixel_type: int) -> str:
+        '''Get the name of the data type of the loader the channels of a pixel type are loaded as
+
+        Args:
+         - pixel_type: Pixel type the channel is decoded as (Imath.PixelType value)
+
+        Returns:
+         - dtype: Name of the data type (See LOADER_DTYPES, UINT channels are int64 with PyTorch)
+        '''
+        if getattr(self.loader, '__name__', None) == 'torch':
+            return TORCH_DTYPES.get(pixel_type, LOADER_DTYPES[pixel_type])
+        return LOADER_DTYPES[pixel_type]
+
+
+    def _allocate_stacked(self) -> Any:
+        '''Allocate an uninitialized array/tensor holding all channels in the layout given by self.stack
+
+        Returns:
+         - stacked: (channels,height,width) or (height,width,channels) shaped array/tensor
+        '''
+        height, width = self.shape
+        if self.stack == 'hwc':
+            shape = (height, width, len(self.channel_keys))
+        else:
+            shape = (len(self.channel_keys), height, width)
+        # Use the common data type of the channels, fall back to float32 if they differ
+        dtypes = set()
+        for channel_name, channel_key in zip(self.channel_names, self.channel_keys):
+            if self.dtypes and channel_key in self.dtypes:
+                dtypes.add(self.dtypes[channel_key])
+            else:
+                dtypes.add(getattr(self.loader, self._loader_dtype(self._pixel_type(channel_name))))
+        dtype = dtypes.pop() if len(dtypes) == 1 else self.loader.float32
+        return self.loader.empty(shape, dtype=dtype)
+
+
+    def _out_slot(self, channel_key: str) -> Any:
+        '''Get the slot of the preallocated output (self.out) of a channel
+
+        Args:
+         - channel_key: Key of the channel
+
+        Returns:
+         - target: The slot of self.out holding the channel data
+        '''
+        if isinstance(self.out, dict):
+            return self.out[channel_key]
+        elif self.stack == 'hwc':
+            return self.out[..., self.channel_keys.index(channel_key)]
+        return self.out[self.channel_keys.index(channel_key)]
+
+
+    def _crop(self, data: Any) -> Any:
+        '''Reshape the data of the decoded scanlines to (height,width) and crop it to the columns of self.window
+
+        Args:
+         - data: 1D array/tensor of the decoded scanlines
+
+        Returns:
+         - data: (height,width) shaped view of the data
+        '''
+        data = data.reshape(self.shape[0], self.resolution[1])  # Reshaping the contiguous buffer returns a view
+        if self.shape[1] != self.resolution[1]:
+            data = data[:, self.window[2]:self.window[3]]
+        return data
+
+
+    def _tolist(self, buffer: bytes, pixel_type: int) -> list:
+        '''Convert a decoded channel buffer to a list of values, cropped to the columns of self.window
+
+        Args:
+         - buffer: Bytes object returned by OpenEXR.InputFile
+         - pixel_type: Pixel type the channel was decoded as (Imath.PixelType value)
+
+        Returns:
+         - values: 1D list of the values of the channel
+        '''
+        values = array(ARRAY_TYPECODES[pixel_type], buffer)
+        width = self.resolution[1]
+        if self.shape[1] != width:
+            cropped = array(ARRAY_TYPECODES[pixel_type])
+            for row in range(self.shape[0]):
+                cropped.extend(values[row*width + self.window[2]:row*width + self.window[3]])
+            values = cropped
+        return values.tolist()
+
+
+    def _frombuffer(self, buffer: bytes, dtype: Any, writable: bool = False) -> Any:
+        '''Wrap a decoded channel buffer with the loader without copying it (unless writable is set)
+
+        Args:
+         - buffer: Bytes object returned by OpenEXR.InputFile
+         - dtype: Data type of the loader to interpret the buffer as
+         - writable: If True, the buffer is copied so the data can be modified
+
+        Returns:
+         - data: (height,width) shaped array/tensor sharing memory with the buffer (or with a writable copy of it)
+        '''
+        if writable:
+            data = self.loader.frombuffer(bytearray(buffer), dtype=dtype)
+        else:
+            with warnings.catch_warnings():
+                # PyTorch warns about non-writable buffers, the tensor must not be modified (See writable)
+                warnings.filterwarnings('ignore', message='The given buffer is not writable')
+                data = self.loader.frombuffer(buffer, dtype=dtype)
+        return self._crop(data)
@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+from typing import Any, Iterator
+import glob
+import os
+
+from exr_reader import OpenEXRReader, OpenEXRWrapper
+from exr_batch import read_many
+
+
+@dataclass
+class SequenceReader():
+    '''Read a sequence of numbered EXR frames generated by BAT (0001.exr, 0002.exr, ...)
+
+    While a frame is being processed, the next frames are decoded on a background thread.
+
+    Args:
+     - source: Directory containing the frames (all .exr files in it, sorted by name) or a printf-style pattern
+               of the frame paths (e.g. 'render/%04d.exr')
+     - channel_string: String describing which channels to load (See OpenEXRReader)
+     - loader: Module to use to load the channel data (See OpenEXRReader)
+     - prefetch: Number of frames decoded ahead of the frame being processed
+     - start: First frame number (Only used with a pattern)
+     - end: Last frame number (Only used with a pattern). If None, frames are read until a frame is missing.
+     - reader_kwargs: Additional arguments of OpenEXRReader (e.g. roi, dtypes, stack)
+
+    Usage:
+    for exr in SequenceReader(DIRECTORY, 'rgb', np):
+        ...
+
+    The frames are the same exr objects as returned by OpenEXRReader, but the files are already closed, so lazy
+    loading and shared output buffers (out) can not be used.
+    '''
+    source: str
+    channel_string: str
+    loader: Any = None
+    prefetch: int = 2
+    start: int = 1
+    end: int = None
+    reader_kwargs: dict = None
+
+
+    def __post_init__(self):
+        '''This will be called at the end of the __init__ method
+        '''
+        self.reader_kwargs = self.reader_kwargs or {}
+        self.paths = self._find_frames()
+
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+    def __getitem__(self, index: int) -> OpenEXRWrapper:
+        '''Read a single frame (without prefetching)
+        '''
+        with OpenEXRReader(self.paths[index], self.channel_string, self.loader, **self.reader_kwargs) as exr:
+            return exr
+
+
+    def __iter__(self) -> Iterator[OpenEXRWrapper]:
+        '''Iterate over the frames in order, while decoding the next frames on a background thread
+        '''
+        return read_many(self.paths, self.channel_string, self.loader, workers=1, prefetch=self.prefetch,
+                         **self.reader_kwargs)
+
+
+    def _find_frames(self) -> list[str]:
+        '''Find the paths of the frames of the sequence
+
+        Returns:
+         - paths: Paths of the frames in order
+        '''
+        if '%' not in self.source:
+            return sorted(glob.glob(os.path.join(glob.escape(self.source), '*.exr')))
+
+        paths = []
+        frame = self.start
+        while self.end is None or frame <= self.end:
+            path = self.source % frame
+            if not os.path.exists(path):
+                if self.end is None:
+                    break
+                raise FileNotFoundError('Frame {} of sequence {} is missing: {}'.format(frame, self.source, path))
+            paths.append(path)
+            frame += 1
+        return paths
@@ -0,0 +1,220 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+
+import numpy as np
+import OpenEXR
+import Imath
+
+from exr_reader import OpenEXRWrapper, parse_channel_string
+
+
+# Compressions and pixel types that can be written, by name
+COMPRESSIONS = {
+    'NONE': Imath.Compression.NO_COMPRESSION,
+    'RLE': Imath.Compression.RLE_COMPRESSION,
+    'ZIPS': Imath.Compression.ZIPS_COMPRESSION,
+    'ZIP': Imath.Compression.ZIP_COMPRESSION,
+    'PIZ': Imath.Compression.PIZ_COMPRESSION,
+    'PXR24': Imath.Compression.PXR24_COMPRESSION,
+    'B44': Imath.Compression.B44_COMPRESSION,
+    'B44A': Imath.Compression.B44A_COMPRESSION,
+    'DWAA': Imath.Compression.DWAA_COMPRESSION,
+    'DWAB': Imath.Compression.DWAB_COMPRESSION,
+}
+PIXEL_TYPES = {'HALF': Imath.PixelType.HALF, 'FLOAT': Imath.PixelType.FLOAT, 'UINT': Imath.PixelType.UINT}
+NUMPY_DTYPES = {Imath.PixelType.HALF: np.float16, Imath.PixelType.FLOAT: np.float32,
+                Imath.PixelType.UINT: np.uint32}
+# Attributes of the header that are set by the writer instead of being copied from the source header
+WRITER_ATTRIBUTES = ('channels', 'compression', 'dataWindow', 'displayWindow')
+
+
+def _header(height: int, width: int, compression: str, source_header: dict = None) -> dict:
+    '''Create the header of an EXR file to write
+
+    Args:
+     - height: Height of the image
+     - width: Width of the image
+     - compression: Name of the compression (See COMPRESSIONS)
+     - source_header: Header of the file the channels were read from (Its other attributes are copied)
+
+    Returns:
+     - header: Header without channels
+    '''
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression "{}", use one of {}'.format(compression, ', '.join(COMPRESSIONS)))
+    header = OpenEXR.Header(width, height)
+    for name, value in (source_header or {}).items():
+        if name not in WRITER_ATTRIBUTES:
+            header[name] = value
+    header['compression'] = Imath.Compression(COMPRESSIONS[compression])
+    header['channels'] = {}
+    return header
+
+
+def _pixel_type(data: np.ndarray) -> int:
+    '''Get the pixel type matching the data type of a channel
+
+    Args:
+     - data: Data of the channel
+
+    Returns:
+     - pixel_type: HALF for float16, UINT for integers, FLOAT otherwise (Imath.PixelType value). Integers that
+                   do not fit into UINT are rejected by write_exr.
+    '''
+    if data.dtype == np.float16:
+        return Imath.PixelType.HALF
+    if data.dtype.kind in 'ui':
+        return Imath.PixelType.UINT
+    return Imath.PixelType.FLOAT
+
+
+def _channel_names(pixel_types: dict) -> dict:
+    '''Convert a dict of pixel types by channel key to a dict of pixel types by channel name
+
+    Args:
+     - pixel_types: Dict mapping channel keys (e.g. 'r') to pixel types ('HALF', 'FLOAT' or 'UINT')
+
+    Returns:
+     - pixel_types: Dict mapping channel names (e.g. 'Image.R') to Imath.PixelType values
+    '''
+    names = {}
+    for channel_key, pixel_type in (pixel_types or {}).items():
+        channel_names, _ = parse_channel_string(channel_key)
+        if len(channel_names) != 1:
+            raise ValueError('Unknown channel key "{}" in pixel_types'.format(channel_key))
+        if pixel_type not in PIXEL_TYPES:
+            raise ValueError('Unknown pixel type "{}", use one of {}'.format(pixel_type, ', '.join(PIXEL_TYPES)))
+        names[channel_names[0]] = PIXEL_TYPES[pixel_type]
+    return names
+
+
+def write_exr(filepath: str, exr: OpenEXRWrapper, compression: str = 'ZIP', pixel_types: dict = None,
+              channel_string: str = None) -> None:
+    '''Write the channels of an exr object (as returned by OpenEXRReader) to an EXR file
+
+    Args:
+     - filepath: Path of the exr file to write
+     - exr: The exr object (With any loader)
+     - compression: Name of the compression (NONE, RLE, ZIPS, ZIP, PIZ, PXR24, B44, B44A, DWAA or DWAB)
+     - pixel_types: Dict mapping channel keys to the pixel types to write them as ('HALF', 'FLOAT' or 'UINT').
+                    The pixel type of the other channels follows their data type.
+     - channel_string: String describing which of the loaded channels to write (All loaded channels if None)
+
+    Usage:
+    with OpenEXRReader(PATH, 'rgbd', np) as exr:
+        write_exr(OUTPUT_PATH, exr, 'ZIPS', {'r': 'HALF', 'g': 'HALF', 'b': 'HALF'})
+
+    The attributes of the header of the source file are kept, the channels get their names in BAT files.
+    '''
+    channel_keys = parse_channel_string(channel_string)[1] if channel_string else exr.channel_names
+    # The channel names are parsed from the keys, the same way as from a channel string
+    channel_names, _ = parse_channel_string(''.join(channel_keys))
+    pixel_types = _channel_names(pixel_types)
+
+    arrays = {}
+    for channel_name, channel_key in zip(channel_names, channel_keys):
+        data = getattr(exr, channel_key)
+        data = np.asarray(data) if not isinstance(data, list) else np.array(data, dtype=np.float32)
+        arrays[channel_name] = (channel_key, data)
+    shape = next(iter(arrays.values()))[1].shape if arrays else exr.shape
+    height, width = shape if len(shape) == 2 else exr.shape
+
+    for channel_name, (channel_key, data) in arrays.items():
+        if data.size != height * width:
+            raise ValueError('Channel {} has {} values, expected {}x{}'.format(channel_key, data.size, height, width))
+
+    header = _header(height, width, compression, exr.header)
+    pixels = {}
+    for channel_name, (channel_key, data) in arrays.items():
+        pixel_type = pixel_types.get(channel_name, _pixel_type(data))
+        if pixel_type == Imath.PixelType.UINT and data.size and (data.min() < 0 or data.max() > 0xffffffff):
+            raise ValueError('Channel {} has values outside of the UINT range [0, 2^32-1], that would wrap '
+                             '(write it as FLOAT instead)'.format(channel_key))
+        header['channels'][channel_name] = Imath.Channel(Imath.PixelType(pixel_type))
+        pixels[channel_name] = np.ascontiguousarray(data, dtype=NUMPY_DTYPES[pixel_type]).tobytes()
+
+    outputfile = OpenEXR.OutputFile(filepath, header)
+    try:
+        outputfile.writePixels(pixels)
+    finally:
+        outputfile.close()
+
+
+def recompress(filepath: str, output_path: str, compression: str = 'ZIP', pixel_types: dict = None,
+               channel_string: str = None) -> None:
+    '''Re-encode an EXR file with another compression (and optionally other pixel types or a subset of channels)
+
+    Args:
+     - filepath: Path of the exr file to read
+     - output_path: Path of the exr file to write
+     - compression: Name of the compression (See write_exr)
+     - pixel_types: Dict mapping channel keys (e.g. 'r', like in write_exr) to the pixel types to write them as
+                    ('HALF', 'FLOAT' or 'UINT'). The other channels keep their pixel type.
+     - channel_string: String describing which channels to write (See OpenEXRReader). All channels if None.
+    '''
+    inputfile = OpenEXR.InputFile(filepath)
+    try:
+        source_header = inputfile.header()
+        data_window = source_header['dataWindow']
+        header = _header(data_window.max.y - data_window.min.y + 1, data_window.max.x - data_window.min.x + 1,
+                         compression, source_header)
+        header['dataWindow'] = data_window
+        header['displayWindow'] = source_header['displayWindow']
+
+        if channel_string:
+            channel_names, _ = parse_channel_string(channel_string)
+        else:
+            channel_names = list(source_header['channels'])
+        pixel_types = _channel_names(pixel_types)
+        for channel_name in channel_names:
+            channel = source_header['channels'][channel_name]
+            if channel_name in pixel_types:
+                channel = Imath.Channel(Imath.PixelType(pixel_types[channel_name]), channel.xSampling,
+                                        channel.ySampling)
+            header['channels'][channel_name] = channel
+
+        # OpenEXR converts the channels to the pixel types to write
+        pixels = {}
+        for channel_name in channel_names:
+            pixel_type = header['channels'][channel_name].type
+            pixels[channel_name] = inputfile.channel(channel_name, pixel_type)
+    finally:
+        inputfile.close()
+
+    outputfile = OpenEXR.OutputFile(output_path, header)
+    try:
+        outputfile.writePixels(pixels)
+    finally:
+        outputfile.close()
+
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Re-encode EXR files with another compression')
+    parser.add_argument('inputs', nargs='+', help='EXR files to re-encode')
+    parser.add_argument('output_dir', help='Directory to write the re-encoded files to (with the same paths '
+                        'relative to the common directory of the inputs)')
+    parser.add_argument('--compression', default='ZIP', choices=list(COMPRESSIONS), help='Compression to use')
+    parser.add_argument('--channels', default=None, help='Channel string of the channels to keep (default: all)')
+    parser.add_argument('--half', nargs='*', default=[], help='Keys of channels to write as HALF (e.g. r g b)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of files to re-encode at the same time')
+    args = parser.parse_args()
+
+    pixel_types = {channel_key: 'HALF' for channel_key in args.half}
+    # Keep the directory structure below the common directory of the inputs, so files with the same name in
+    # different directories (e.g. 0001.exr of several sequences) do not overwrite each other
+    inputs = list(dict.fromkeys(os.path.abspath(filepath) for filepath in args.inputs))
+    root = os.path.commonpath([os.path.dirname(filepath) for filepath in inputs])
+    output_paths = {filepath: os.path.join(args.output_dir, os.path.relpath(filepath, root)) for filepath in inputs}
+    for output_dir in set(map(os.path.dirname, output_paths.values())):
+        os.makedirs(output_dir, exist_ok=True)
+
+    def run(filepath: str) -> None:
+        output_path = output_paths[filepath]
+        recompress(filepath, output_path, args.compression, pixel_types, args.channels)
+        print('{} -> {} ({} -> {} bytes)'.format(filepath, output_path, os.path.getsize(filepath),
+                                                os.path.getsize(output_path)))
+
+    with ThreadPoolExecutor(max_workers=args.workers or os.cpu_count() or 1) as executor:
+        list(executor.map(run, inputs))
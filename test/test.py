@@ -4,7 +4,7 @@ current_dir_path = os.path.dirname(os.path.realpath(__file__))
 parent_dir_path = os.path.dirname(current_dir_path)
 sys.path.append(parent_dir_path)
 
-from exr_reader import OpenEXRReader
+from exr_reader import OpenEXRReader, MissingChannelError
 
 
 if __name__=='__main__':
@@ -28,30 +28,47 @@ if __name__=='__main__':
         print('Could not access channel(s) "{}", because they are not loaded!'.format(chstr))
 
 
-    # When trying to load a channel that is not in the file TypeError is thrown
+    # When trying to load a channel that is not in the file MissingChannelError is thrown (before decoding anything)
     try:
         chstr = 'd'
         with OpenEXRReader(filepath_missing, chstr) as exr:
             print('Data type of channel with default loader: {}\n'.format(type(exr.d)))
-    except TypeError:
-        print('Cannot load channel(s) with key(s) "{}" from file {}, because the channel is missing!\n'.format(chstr, filepath_missing))
+    except MissingChannelError as e:
+        print('Cannot load channel(s) with key(s) "{}" from file {}, because the channel is missing!'.format(''.join(e.channel_keys), filepath_missing))
+
+    # Missing channels can also be skipped or loaded as zeros
+    with OpenEXRReader(filepath_missing, 'rd', missing='zeros') as exr:
+        print('Missing channel loaded as zeros: {}\n'.format(not any(exr.d)))
 
 
     import numpy as np
     import matplotlib.pyplot as plt
 
     # Open the file with NumPy as the loader and load the surface normal channels
-    with OpenEXRReader(filepath,'nxnynz', np) as exr:
+    with OpenEXRReader(filepath,'nxnynz', np, stack='hwc') as exr:
         print('Data type of channel with numpy loader: {}'.format(type(exr.nx)))
-        r = np.reshape(exr.nx,(exr.resolution))
-        g = np.reshape(exr.ny,(exr.resolution))
-        b = np.reshape(exr.nz,(exr.resolution))
-        plt.imshow(np.moveaxis(np.stack([r,g,b]),[0],[2]))
+        print('Shape of stacked channels with numpy loader: {}'.format(exr.stacked.shape))
+        plt.imshow(exr.stacked)
         plt.show()
     
 
     import torch
 
+    from exr_cache import ChannelCache
+
+    # Channels from a cache are shared between readers, so they can not be modified in place (unless writable)
+    cache = ChannelCache(1024**3)
+    with OpenEXRReader(filepath, 'c', np, dtypes={'c': np.uint8}, cache=cache) as exr:
+        try:
+            exr.c[0, 0] = 77
+        except ValueError:
+            print('Cached channel is read-only')
+    with OpenEXRReader(filepath, 'c', torch, cache=cache) as exr:
+        exr.c[0, 0] = 77  # PyTorch channels are copies of the cached data
+    with OpenEXRReader(filepath, 'c', torch, cache=cache) as exr:
+        assert exr.c[0, 0] != 77, 'Cached channel was modified'
+
+
     # Open the file with PyTorch as the loader and load the forward optical flow channels
     with OpenEXRReader(filepath,'fxfy', torch) as exr:
-        print('Data type of channel with torch loader: {}'.format(type(exr.fx)))
\ No newline at end of file
+        print('Data type of channel with torch loader: {}'.format(type(exr.fx)))